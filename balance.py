@@ -0,0 +1,287 @@
+import heapq
+import itertools
+import time
+
+import numpy as np
+import trueskill as ts
+
+# For two teams, TrueSkill match quality only depends on the number of players,
+# the sum of all sigma^2 (both fixed for a given lobby) and the difference between
+# the teams' mu sums. Quality strictly decreases as |mu sum difference| grows, so
+# the searches below rank splits by that difference and only call ts.quality
+# on the splits they return.
+
+# lobbies up to this size are searched exhaustively
+EXHAUSTIVE_LIMIT = 12
+
+# time budget (seconds) for the heuristic search on larger lobbies
+DEADLINE = 0.05
+
+# time budget (seconds) for splitting a lobby into several matches
+MATCHES_DEADLINE = 0.5
+
+# objectives for balance_matches
+MIN_QUALITY = 'min'
+TOTAL_QUALITY = 'total'
+
+
+def balance_teams(ratings, top_k=1, deadline=DEADLINE):
+    '''
+    Finds the most balanced splits of a lobby into two teams.
+    The first team always has len(ratings) // 2 players.
+    :param ratings: dict of userid -> TrueSkill.Rating
+    :param top_k: number of splits to return
+    :param deadline: time budget in seconds for lobbies too big to search exhaustively
+    :return: list of (team1, team2, quality) tuples, best first
+    '''
+    players = sorted(ratings, key=lambda id: ratings[id].mu, reverse=True)
+    if len(players) < 2:
+        return [(players[:len(players) // 2], players[len(players) // 2:], 0.0)]
+    mus = [ratings[id].mu for id in players]
+    if len(players) <= EXHAUSTIVE_LIMIT:
+        splits = _exhaustive(mus, top_k)
+    else:
+        splits = _heuristic(mus, top_k, time.perf_counter() + deadline)
+    # score every returned split in one call
+    teams = np.full((len(splits), len(players)), -1, dtype=np.int8)
+    for row, team1 in enumerate(splits):
+        teams[row, list(team1)] = 1
+    sigmas = [ratings[id].sigma for id in players]
+    qualities = batch_quality(mus, sigmas, teams)
+    result = []
+    for row, team1 in enumerate(splits):
+        members = set(team1)
+        t1 = [players[i] for i in team1]
+        t2 = [players[i] for i in range(len(players)) if i not in members]
+        result.append((t1, t2, float(qualities[row])))
+    return result
+
+
+def balance_matches(ratings, team_size=5, objective=MIN_QUALITY, deadline=MATCHES_DEADLINE):
+    '''
+    Splits a lobby into several team_size vs team_size matches.
+    Players are dealt to the matches in a snake draft by mu, every match is split
+    into its most balanced two teams, and players are then swapped between matches
+    while that improves the objective and the deadline has not passed.
+    :param ratings: dict of userid -> TrueSkill.Rating, a multiple of 2 * team_size players
+    :param objective: MIN_QUALITY maximizes the worst match's quality (ties broken by the total),
+        TOTAL_QUALITY maximizes the sum of all qualities
+    :return: list of (team1, team2, quality) tuples, strongest match first
+    '''
+    players = sorted(ratings, key=lambda id: ratings[id].mu, reverse=True)
+    if team_size < 1 or not players or len(players) % (2 * team_size):
+        raise ValueError(f'{len(players)} players cannot be split into {team_size}v{team_size} matches')
+    mus = [ratings[id].mu for id in players]
+    sigmas = [ratings[id].sigma for id in players]
+    count = len(players) // (2 * team_size)
+    stop = time.perf_counter() + deadline
+    # players are indexed in descending mu order, so a sorted group is what _exhaustive expects
+    groups = [[] for _ in range(count)]
+    for rank in range(len(players)):
+        draft_round, pick = divmod(rank, count)
+        groups[pick if draft_round % 2 == 0 else count - 1 - pick].append(rank)
+    splits = {}
+
+    def split(group):
+        # best (quality, first team) of one match, memoized by its players
+        group = tuple(sorted(group))
+        if group not in splits:
+            group_mus = [mus[i] for i in group]
+            if len(group) <= EXHAUSTIVE_LIMIT:
+                team1 = _exhaustive(group_mus, 1)[0]
+            else:
+                team1 = _heuristic(group_mus, 1, time.perf_counter() + DEADLINE)[0]
+            teams = np.full(len(group), -1, dtype=np.int8)
+            teams[list(team1)] = 1
+            quality = float(batch_quality(group_mus, [sigmas[i] for i in group], teams)[0])
+            splits[group] = quality, [group[i] for i in team1]
+        return splits[group]
+
+    def score(qualities):
+        if objective == MIN_QUALITY:
+            return min(qualities), sum(qualities)
+        return sum(qualities)
+
+    qualities = [split(group)[0] for group in groups]
+    improved = True
+    while improved and time.perf_counter() < stop:
+        improved = False
+        current = score(qualities)
+        # the worst matches are the ones worth fixing first
+        order = sorted(range(count), key=qualities.__getitem__)
+        for a, b in itertools.combinations(order, 2):
+            for i, j in itertools.product(range(len(groups[a])), range(len(groups[b]))):
+                if time.perf_counter() >= stop:
+                    break
+                if mus[groups[a][i]] == mus[groups[b][j]]:
+                    continue
+                group_a, group_b = list(groups[a]), list(groups[b])
+                group_a[i], group_b[j] = group_b[j], group_a[i]
+                candidate = list(qualities)
+                candidate[a], candidate[b] = split(group_a)[0], split(group_b)[0]
+                if score(candidate) > current:
+                    groups[a], groups[b], qualities = group_a, group_b, candidate
+                    improved = True
+                    break
+            if improved:
+                break
+
+    result = []
+    for group in sorted(groups, key=lambda group: -sum(mus[i] for i in group)):
+        quality, team1 = split(group)
+        t1 = [players[i] for i in team1]
+        t2 = [players[i] for i in sorted(group) if i not in set(team1)]
+        result.append((t1, t2, quality))
+    return result
+
+
+def batch_quality(mus, sigmas, teams, beta=None):
+    '''
+    Vectorized ts.quality for many two-team matchups drawn from the same players.
+    With two teams the TrueSkill quality matrix collapses to
+    sqrt(n*beta^2 / c) * exp(-delta^2 / (2*c)), where c = n*beta^2 + sum(sigma^2)
+    and delta is the difference between the teams' mu sums.
+    :param mus: sequence of n player mus
+    :param sigmas: sequence of n player sigmas
+    :param teams: int array of shape (m, n), 1 for the first team, -1 for the second, 0 if not playing
+    :param beta: TrueSkill beta, defaults to the global environment's
+    :return: array of m match qualities
+    '''
+    if beta is None:
+        beta = ts.global_env().beta
+    mus = np.asarray(mus, dtype=np.float64)
+    variances = np.square(np.asarray(sigmas, dtype=np.float64))
+    teams = np.atleast_2d(np.asarray(teams, dtype=np.float64))
+    playing = teams != 0
+    n = playing.sum(axis=1)
+    c = n * beta ** 2 + playing @ variances
+    delta = teams @ mus
+    return np.sqrt(n * beta ** 2 / c) * np.exp(-np.square(delta) / (2 * c))
+
+
+def _exhaustive(mus, top_k):
+    '''
+    Depth-first search over every distinct first team, pruning branches whose best
+    reachable mu difference cannot beat the current top_k.
+    :param mus: player mus, sorted descending
+    :return: list of first teams (tuples of indices into mus), best first
+    '''
+    n = len(mus)
+    size = n // 2
+    total = sum(mus)
+    # players still available from each start index
+    suffix = [mus[i:] for i in range(n + 1)]
+    best = []    # max-heap on difference: (-diff, team)
+
+    def worst():
+        return -best[0][0] if len(best) == top_k else float('inf')
+
+    def search(start, chosen, chosen_sum):
+        remaining = size - len(chosen)
+        if remaining == 0:
+            diff = abs(total - 2 * chosen_sum)
+            if diff < worst():
+                entry = (-diff, tuple(chosen))
+                if len(best) < top_k:
+                    heapq.heappush(best, entry)
+                else:
+                    heapq.heapreplace(best, entry)
+            return
+        if n - start < remaining:
+            return
+        # bound: the first team's sum must land between these two values
+        rest = suffix[start]
+        low = chosen_sum + sum(rest[-remaining:])
+        high = chosen_sum + sum(rest[:remaining])
+        target = total / 2
+        gap = max(low - target, target - high, 0.0)
+        if 2 * gap >= worst():
+            return
+        chosen.append(start)
+        search(start + 1, chosen, chosen_sum + mus[start])
+        chosen.pop()
+        search(start + 1, chosen, chosen_sum)
+
+    if n % 2 == 0:
+        # the strongest player always goes on the first team to skip mirrored splits
+        search(1, [0], mus[0])
+    else:
+        search(0, [], 0.0)
+    return [team for _, team in sorted(best, key=lambda x: -x[0])]
+
+
+def _heuristic(mus, top_k, deadline):
+    '''
+    Balanced Karmarkar-Karp seeding followed by pairwise swap improvement until
+    no swap helps or the deadline passes.
+    :param mus: player mus, sorted descending
+    :return: list of first teams (tuples of indices into mus), best first
+    '''
+    n = len(mus)
+    size = n // 2
+    total = sum(mus)
+    team1 = _karmarkar_karp(mus)
+    if len(team1) != size:
+        team1 = [i for i in range(n) if i not in set(team1)]
+    seen = {}
+
+    def remember(team):
+        team = tuple(sorted(team))
+        seen[team] = abs(total - 2 * sum(mus[i] for i in team))
+
+    remember(team1)
+    mu_array = np.asarray(mus)
+    in_team1 = [False] * n
+    for i in team1:
+        in_team1[i] = True
+    diff = total - 2 * sum(mus[i] for i in team1)    # team2 sum - team1 sum
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        members = np.array(in_team1)
+        # |difference| after swapping every (team1 player, team2 player) pair
+        swaps = np.abs(diff + 2 * np.subtract.outer(mu_array[members], mu_array[~members]))
+        a, b = np.unravel_index(np.argmin(swaps), swaps.shape)
+        if swaps[a, b] < abs(diff):
+            a, b = np.flatnonzero(members)[a], np.flatnonzero(~members)[b]
+            in_team1[a], in_team1[b] = False, True
+            diff += 2 * (mus[a] - mus[b])
+            remember(i for i in range(n) if in_team1[i])
+            improved = True
+    # neighbours of the final split are the natural runners-up
+    if top_k > 1:
+        current = [i for i in range(n) if in_team1[i]]
+        others = [i for i in range(n) if not in_team1[i]]
+        for a, b in itertools.product(current, others):
+            if time.perf_counter() >= deadline and len(seen) >= top_k:
+                break
+            remember([i for i in current if i != a] + [b])
+    return heapq.nsmallest(top_k, seen, key=seen.get)
+
+
+def _karmarkar_karp(mus):
+    '''
+    Balanced largest differencing: players are paired by rank, and pairs are then
+    combined largest difference first, keeping both teams the same size.
+    :param mus: player mus, sorted descending
+    :return: list of indices on one side of the partition
+    '''
+    indices = list(range(len(mus)))
+    if len(indices) % 2 == 1:
+        # a zero-mu placeholder evens the pairing and is dropped afterwards
+        indices.append(None)
+    value = lambda i: 0.0 if i is None else mus[i]
+    heap = []
+    for k in range(0, len(indices), 2):
+        a, b = indices[k], indices[k + 1]
+        heapq.heappush(heap, (-(value(a) - value(b)), k, [a], [b]))
+    counter = len(indices)
+    while len(heap) > 1:
+        d1, _, big1, small1 = heapq.heappop(heap)
+        d2, _, big2, small2 = heapq.heappop(heap)
+        # put the larger side of one node with the smaller side of the other
+        heapq.heappush(heap, (d1 - d2, counter, big1 + small2, small1 + big2))
+        counter += 1
+    _, _, side1, side2 = heap[0]
+    side = side1 if None in side1 else side2
+    return [i for i in side if i is not None]
@@ -0,0 +1,335 @@
+'''
+Offline benchmarks for the bot.
+Runs the real event handlers from main.py against an in-process fake Discord client
+(no network) on synthetic guilds, plus micro-benchmarks of the hot helpers, and writes
+the results as JSON so runs can be compared.
+
+    python benchmark.py --guilds 20 --players 200 --lobby 10 --commands 500 --output bench.json
+    python benchmark.py --compare bench.json
+'''
+import argparse
+import asyncio
+import atexit
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+# keep benchmark data and logs away from the live bot's files; must be set before importing main
+BENCH_DIR = tempfile.mkdtemp(prefix='beep_boop_bench_')
+# registered first so it runs last, after main has closed its database and log files
+atexit.register(shutil.rmtree, BENCH_DIR, ignore_errors=True)
+os.environ.setdefault('RATINGS_DB', os.path.join(BENCH_DIR, 'ratings.sqlite3'))
+os.environ.setdefault('LOG_FILE', os.path.join(BENCH_DIR, 'discord.log'))
+os.environ.setdefault('SHELVE_DIR', BENCH_DIR)
+
+import trueskill as ts
+
+import main
+from balance import balance_teams
+
+# default command mix for the end-to-end run: command -> weight
+COMMAND_MIX = {
+    'rated': 4,
+    'unrated': 1,
+    'attackers': 2,
+    'defenders': 2,
+    'leaderboard': 2,
+    'rating': 3,
+    'move': 1,
+    'back': 1,
+    'help': 1,
+}
+
+# relative slowdown of p50 reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.10
+
+# slowdowns smaller than this (ms) are treated as timer noise
+REGRESSION_FLOOR_MS = 0.05
+
+
+# fake Discord objects, implementing only what main.py uses
+_ids = itertools.count(10 ** 17)
+
+
+class FakeUser:
+    def __init__(self, id, name=None):
+        self.id = id
+        self.name = name or f'user{id}'
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeMember(FakeUser):
+    def __init__(self, guild, id):
+        super().__init__(id)
+        self.guild = guild
+        self.voice = None
+
+    async def move_to(self, channel):
+        if self.voice is not None:
+            before = self.voice.channel
+            before.members.remove(self)
+        else:
+            before = None
+        channel.members.append(self)
+        self.voice = FakeVoiceState(channel)
+        start = time.perf_counter()
+        await main.on_voice_state_update(self, FakeVoiceState(before), self.voice)
+        self.guild.timings.add('on_voice_state_update', time.perf_counter() - start)
+
+
+class FakeChannel:
+    def __init__(self, guild, name='general', category=None):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.category = category
+        self.members = []
+
+    async def send(self, content):
+        return FakeMessage(self, content, self.guild.client_user)
+
+    async def fetch_message(self, id):
+        return FakeMessage(self, '', self.guild.client_user, id=id)
+
+    async def delete(self):
+        self.guild.channels.pop(self.id, None)
+        await main.on_guild_channel_delete(self)
+
+
+class FakeMessage:
+    def __init__(self, channel, content, author, id=None):
+        self.id = id or next(_ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.author = author
+        self.raw_mentions = []
+        self.reactions = []
+
+    async def edit(self, content):
+        self.content = content
+
+
+class FakeGuild:
+    def __init__(self, player_count, client_user, timings):
+        self.id = next(_ids)
+        self.client_user = client_user
+        self.timings = timings
+        self.members = {id: FakeMember(self, id) for id in (next(_ids) for _ in range(player_count))}
+        self.channels = {}
+        self.text_channel = FakeChannel(self)
+        self.lobby_channel = FakeChannel(self, 'lobby')
+
+    def get_member(self, id):
+        return self.members.get(id)
+
+    def get_channel(self, id):
+        return self.channels.get(id)
+
+    async def create_category_channel(self, name):
+        channel = FakeChannel(self, name)
+        self.channels[channel.id] = channel
+        return channel
+
+    async def create_voice_channel(self, name, category=None):
+        channel = FakeChannel(self, name, category)
+        self.channels[channel.id] = channel
+        return channel
+
+
+class FakePayload:
+    def __init__(self, guild, message, userid, emoji='👍'):
+        self.guild_id = guild.id
+        self.channel_id = message.channel.id
+        self.message_id = message.id
+        self.user_id = userid
+        self.emoji = emoji
+
+
+class Timings:
+    '''
+    Latency samples per operation name.
+    '''
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def summary(self):
+        result = {}
+        for name, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            total = sum(ordered)
+            result[name] = {
+                'count': len(ordered),
+                'p50_ms': 1000 * ordered[len(ordered) // 2],
+                'p99_ms': 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+                'mean_ms': 1000 * statistics.mean(ordered),
+                'throughput_per_s': len(ordered) / total if total else float('inf'),
+            }
+        return result
+
+
+def timed(timings, name, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    timings.add(name, time.perf_counter() - start)
+    return result
+
+
+def bench_helpers(timings, guild, lobby_size, iterations):
+    '''
+    Micro-benchmarks of the synchronous helpers behind the commands.
+    '''
+    players = list(guild.members)
+    for _ in range(iterations):
+        lobby = random.sample(players, lobby_size)
+        ratings = {id: main.get_skill(id, guild.id) for id in lobby}
+        timed(timings, 'balance_teams', balance_teams, ratings)
+        half = lobby_size // 2
+        timed(timings, 'record_result', main.record_result, lobby[:half], lobby[half:], guild.id)
+        timed(timings, 'read_leaderboard', main.read_leaderboard, guild, random.randint(1, 3))
+        userid = random.choice(players)
+        timed(timings, 'store.get', main.store.get, guild.id, userid)
+        timed(timings, 'store.set', main.store.set, guild.id, userid, 25.0, 8.0)
+        timed(timings, 'store.get_many', main.store.get_many, guild.id, lobby)
+    timed(timings, 'store.flush', main.store.flush)
+    timed(timings, 'store.all', main.store.all, guild.id)
+
+
+async def run_guild(timings, guild, lobby_size, commands, mix):
+    '''
+    Drives one synthetic guild through $start, reactions and a random command mix.
+    '''
+    admin = FakeUser(main.ADMINS[0])
+    members = list(guild.members.values())
+    names, weights = zip(*mix.items())
+
+    async def command(text, author):
+        message = FakeMessage(guild.text_channel, text, author)
+        start = time.perf_counter()
+        await main.on_message(message)
+        timings.add('on_message $' + text.split()[0][1:], time.perf_counter() - start)
+
+    async def new_lobby():
+        await command('$start', admin)
+        lobby = main.guild_to_lobby[guild.id]
+        for member in random.sample(members, lobby_size):
+            if member.voice is None:
+                await member.move_to(guild.lobby_channel)
+            start = time.perf_counter()
+            await main.on_raw_reaction_add(FakePayload(guild, lobby.message, member.id))
+            timings.add('on_raw_reaction_add', time.perf_counter() - start)
+
+    await new_lobby()
+    await command('$rated', admin)
+    for _ in range(commands):
+        name = random.choices(names, weights)[0]
+        if name in ('attackers', 'defenders'):
+            await command(f'${name}', admin)
+            await new_lobby()
+        elif name == 'rating':
+            await command('$rating', random.choice(members))
+        else:
+            await command(f'${name}', admin)
+
+
+async def run_end_to_end(timings, guilds, lobby_size, commands, mix):
+    main.client.get_channel = lambda id: None
+    for guild in guilds:
+        await run_guild(timings, guild, lobby_size, commands, mix)
+    # drop start message edits still waiting in the coalescer
+    for task in [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]:
+        task.cancel()
+
+
+def compare(old, new):
+    '''
+    :return: list of (operation, old p50 ms, new p50 ms) that got slower than REGRESSION_THRESHOLD
+    '''
+    regressions = []
+    for name, stats in new['operations'].items():
+        before = old['operations'].get(name)
+        if before is None or stats['p50_ms'] - before['p50_ms'] < REGRESSION_FLOOR_MS:
+            continue
+        if stats['p50_ms'] > before['p50_ms'] * (1 + REGRESSION_THRESHOLD):
+            regressions.append((name, before['p50_ms'], stats['p50_ms']))
+    return regressions
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip().lstrip('$')] = float(weight or 1)
+    return mix
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, default=10, help='synthetic guilds to simulate')
+    parser.add_argument('--players', type=int, default=200, help='members per guild')
+    parser.add_argument('--lobby', type=int, default=10, help='players reacting to each $start')
+    parser.add_argument('--commands', type=int, default=200, help='commands sent per guild')
+    parser.add_argument('--iterations', type=int, default=200, help='iterations of each helper micro-benchmark')
+    parser.add_argument('--mix', type=parse_mix, default=COMMAND_MIX, help='command weights, e.g. rated=4,rating=3')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='earlier JSON results to check for regressions')
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    for command in main.router.commands.values():
+        command.cooldown = 0
+    client_user = FakeUser(next(_ids), 'bot')
+    main.client._connection.user = client_user
+    timings = Timings()
+    guilds = [FakeGuild(args.players, client_user, timings) for _ in range(args.guilds)]
+
+    wall_start = time.perf_counter()
+    bench_helpers(timings, guilds[0], args.lobby, args.iterations)
+    asyncio.run(run_end_to_end(timings, guilds, args.lobby, args.commands, args.mix))
+    wall = time.perf_counter() - wall_start
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    main.executor.shutdown()
+    main.store.flush()
+
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'trueskill': ts.__version__},
+        'wall_seconds': wall,
+        'memory': {'peak_rss_bytes': peak, 'ratings_cache': main.ratings_cache.stats()},
+        'operations': timings.summary(),
+    }
+    for name, stats in results['operations'].items():
+        print(f"{name:32} n={stats['count']:6} p50={stats['p50_ms']:8.3f}ms p99={stats['p99_ms']:8.3f}ms {stats['throughput_per_s']:10.1f}/s")
+    print(f"wall {wall:.2f}s, peak RSS {peak / 2 ** 20:.1f} MiB")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results)
+        for name, before, after in regressions:
+            print(f'REGRESSION {name}: p50 {before:.3f}ms -> {after:.3f}ms')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+
+# most ratings kept for a single guild
+PER_GUILD_LIMIT = 2000
+
+# most ratings kept across all guilds
+GLOBAL_LIMIT = 50000
+
+
+class RatingsCache:
+    '''
+    Bounded LRU cache of TrueSkill ratings, grouped by guild.
+    Each guild keeps its own LRU of players capped at per_guild_limit, and whole
+    guilds are evicted least recently used first once global_limit is exceeded.
+    Pinned guilds (those with an active lobby) are never evicted as a whole.
+    Safe to use from several threads.
+    '''
+
+    def __init__(self, per_guild_limit=PER_GUILD_LIMIT, global_limit=GLOBAL_LIMIT):
+        self.per_guild_limit = per_guild_limit
+        self.global_limit = global_limit
+        # guildid -> OrderedDict of userid -> TrueSkill.Rating, least recent first
+        self._guilds = OrderedDict()
+        self._pinned = set()
+        self._lock = threading.RLock()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, key):
+        with self._lock:
+            guildid, userid = key
+            guild = self._guilds.get(int(guildid))
+            return guild is not None and int(userid) in guild
+
+    def get(self, guildid, userid):
+        '''
+        :return: cached rating of userid in guildid, or None on a miss
+        '''
+        with self._lock:
+            guildid, userid = int(guildid), int(userid)
+            guild = self._guilds.get(guildid)
+            if guild is None or userid not in guild:
+                self.misses += 1
+                return None
+            self.hits += 1
+            guild.move_to_end(userid)
+            self._guilds.move_to_end(guildid)
+            return guild[userid]
+
+    def put(self, guildid, userid, rating):
+        self.put_many(guildid, {userid: rating})
+
+    def put_many(self, guildid, ratings):
+        '''
+        :param ratings: dict of userid -> TrueSkill.Rating
+        '''
+        with self._lock:
+            guildid = int(guildid)
+            guild = self._guilds.get(guildid)
+            if guild is None:
+                guild = self._guilds[guildid] = OrderedDict()
+            self._guilds.move_to_end(guildid)
+            for userid, rating in ratings.items():
+                userid = int(userid)
+                if userid not in guild:
+                    self._size += 1
+                guild[userid] = rating
+                guild.move_to_end(userid)
+            while len(guild) > self.per_guild_limit:
+                guild.popitem(last=False)
+                self._size -= 1
+                self.evictions += 1
+            self._evict()
+
+    def warm_load(self, guildid, ratings):
+        '''
+        Loads a guild's stored ratings ahead of matchmaking, without overwriting
+        anything already cached (cached entries are never older than storage).
+        :param ratings: dict of userid -> TrueSkill.Rating
+        '''
+        with self._lock:
+            guild = self._guilds.get(int(guildid), {})
+            self.put_many(guildid, {userid: rating for userid, rating in ratings.items() if int(userid) not in guild})
+
+    def drop_guild(self, guildid):
+        with self._lock:
+            guild = self._guilds.pop(int(guildid), None)
+            if guild is not None:
+                self._size -= len(guild)
+
+    def pin(self, guildid):
+        with self._lock:
+            self._pinned.add(int(guildid))
+
+    def unpin(self, guildid):
+        with self._lock:
+            self._pinned.discard(int(guildid))
+
+    def _evict(self):
+        if self._size <= self.global_limit:
+            return
+        for guildid in list(self._guilds):
+            if self._size <= self.global_limit:
+                break
+            if guildid in self._pinned:
+                continue
+            guild = self._guilds.pop(guildid)
+            self._size -= len(guild)
+            self.evictions += len(guild)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': self._size,
+                'guilds': len(self._guilds),
+            }
@@ -0,0 +1,92 @@
+import threading
+
+from storage import DB_PATH, connect
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS voice_channels (
+    guild_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    channel_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, kind)
+);
+'''
+
+# kinds of channels the bot creates for a match
+CATEGORY = 'category'
+ATTACKERS = 'attackers'
+DEFENDERS = 'defenders'
+
+
+def match_kind(kind, match=1):
+    '''
+    :return: registry kind of a voice channel of the given match (1-based); match 1 keeps the plain kind
+    '''
+    return kind if match == 1 else f'{kind}-{match}'
+
+
+class ChannelRegistry:
+    '''
+    Persistent record of the category and voice channels the bot created in each guild.
+    Everything is mirrored in memory, so checking whether a channel belongs to the
+    bot is a single set lookup. add and discard only change the in-memory maps and
+    can run on the event loop; persist_add and persist_discard do the matching
+    SQLite writes and belong on a storage thread.
+    '''
+
+    def __init__(self, path=DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(SCHEMA)
+        # guild_id -> {kind: channel_id}
+        self._guilds = {}
+        # channel_id -> guild_id
+        self._channels = {}
+        for guild_id, kind, channel_id in self._conn.execute('SELECT guild_id, kind, channel_id FROM voice_channels'):
+            self._guilds.setdefault(guild_id, {})[kind] = channel_id
+            self._channels[channel_id] = guild_id
+
+    def __contains__(self, channel_id):
+        return channel_id in self._channels
+
+    def get(self, guildid, kind):
+        '''
+        :return: id of the guild's channel of this kind, or None
+        '''
+        return self._guilds.get(guildid, {}).get(kind)
+
+    def add(self, guildid, kind, channel_id):
+        with self._lock:
+            old = self._guilds.setdefault(guildid, {}).get(kind)
+            if old is not None:
+                self._channels.pop(old, None)
+            self._guilds[guildid][kind] = channel_id
+            self._channels[channel_id] = guildid
+
+    def persist_add(self, guildid, kind, channel_id):
+        self._conn.execute('INSERT OR REPLACE INTO voice_channels (guild_id, kind, channel_id) VALUES (?, ?, ?)',
+                           (guildid, kind, channel_id))
+
+    def discard(self, channel_id):
+        '''
+        Forgets a channel, e.g. after it was deleted.
+        :return: id of the guild the channel belonged to, or None if it was not registered
+        '''
+        with self._lock:
+            guildid = self._channels.pop(channel_id, None)
+            if guildid is None:
+                return None
+            kinds = self._guilds.get(guildid, {})
+            for kind in [kind for kind, id in kinds.items() if id == channel_id]:
+                del kinds[kind]
+            if not kinds:
+                self._guilds.pop(guildid, None)
+            return guildid
+
+    def persist_discard(self, channel_id):
+        self._conn.execute('DELETE FROM voice_channels WHERE channel_id = ?', (channel_id,))
+
+    def channels(self, guildid):
+        '''
+        :return: dict of kind -> channel_id for a guild
+        '''
+        return dict(self._guilds.get(guildid, {}))
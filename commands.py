@@ -0,0 +1,86 @@
+import logging
+import time
+
+from metrics import COMMAND_LATENCY
+from storage import MigrationError
+
+log = logging.getLogger('bot.commands')
+
+
+class Command:
+    '''
+    A registered chat command.
+    :param handler: coroutine called with (message, args)
+    :param admin: only users in the router's admins may run it
+    :param cooldown: seconds before the command can run again in the same guild
+    :param denied: reply sent to users without permission
+    '''
+
+    def __init__(self, name, handler, admin=False, cooldown=0.0, denied='Permission denied.'):
+        self.name = name
+        self.handler = handler
+        self.admin = admin
+        self.cooldown = cooldown
+        self.denied = denied
+
+
+class CommandRouter:
+    '''
+    Dispatches messages like "$name arg1 arg2" to registered handlers with a single dict lookup.
+    '''
+
+    def __init__(self, prefix='$', admins=()):
+        self.prefix = prefix
+        self.admins = admins
+        self.commands = {}
+        # (guild id, command name) -> time the command last ran
+        self._last_run = {}
+        # (guild id, command name) -> last run a cooldown reply was sent for, so each cooldown replies once
+        self._cooldown_replied = {}
+
+    def command(self, name, admin=False, cooldown=0.0, denied='Permission denied.'):
+        '''
+        Decorator registering a handler coroutine for self.prefix + name.
+        '''
+        def register(handler):
+            self.commands[name] = Command(name, handler, admin, cooldown, denied)
+            return handler
+        return register
+
+    async def dispatch(self, message):
+        '''
+        :return: True if the message was handled by a command
+        '''
+        content = message.content
+        if not content.startswith(self.prefix) or message.guild is None:
+            return False
+        tokens = content[len(self.prefix):].split()
+        if not tokens:
+            return False
+        command = self.commands.get(tokens[0].lower())
+        if command is None:
+            return False
+        if command.admin and message.author.id not in self.admins:
+            await message.channel.send(command.denied)
+            return True
+        if command.cooldown:
+            key = message.guild.id, command.name
+            now = time.monotonic()
+            last_run = self._last_run.get(key, float('-inf'))
+            if now - last_run < command.cooldown:
+                if self._cooldown_replied.get(key) != last_run:
+                    self._cooldown_replied[key] = last_run
+                    remaining = command.cooldown - (now - last_run)
+                    await message.channel.send(f'*${command.name}* is on cooldown, try again in {remaining:.1f}s.')
+                return True
+            self._last_run[key] = now
+        start_time = time.perf_counter()
+        try:
+            with COMMAND_LATENCY.time(command.name):
+                await command.handler(message, tokens[1:])
+        except MigrationError:
+            # already logged by the store, once per guild
+            await message.channel.send("This server's ratings could not be imported from the old storage, so rating commands are unavailable. Ask the bot owner to check the logs.")
+            return True
+        log.debug('Command handled', extra={'guild': message.guild.id, 'command': command.name, 'duration': time.perf_counter()-start_time})
+        return True
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+log = logging.getLogger('bot.edits')
+
+# seconds to wait after the first change before editing, so a burst becomes one edit
+COALESCE_WINDOW = 0.75
+
+# minimum seconds between two edits in the same channel
+CHANNEL_EDIT_INTERVAL = 1.0
+
+
+class EditCoalescer:
+    '''
+    Coalesces message edits.
+    The first change to a message schedules one edit after a short window; later
+    changes inside that window only replace the pending content. Edits within a
+    channel are serialized and rate capped, so the last content always lands last.
+    '''
+
+    def __init__(self, window=COALESCE_WINDOW, channel_interval=CHANNEL_EDIT_INTERVAL):
+        self.window = window
+        self.channel_interval = channel_interval
+        # message id -> (message, content) waiting to be sent
+        self._pending = {}
+        # message id -> scheduled edit task
+        self._tasks = {}
+        # message id -> last content sent
+        self._sent = {}
+        self._channel_locks = {}
+        self._channel_last_edit = {}
+
+    def schedule(self, message, content):
+        '''
+        Sets the content a message should end up with.
+        '''
+        self._pending[message.id] = message, content
+        task = self._tasks.get(message.id)
+        if task is None or task.done():
+            self._tasks[message.id] = asyncio.ensure_future(self._edit_later(message.id))
+
+    def discard(self, message):
+        '''
+        Forgets a message, e.g. when its lobby is replaced by a new $start.
+        '''
+        self._pending.pop(message.id, None)
+        self._sent.pop(message.id, None)
+        task = self._tasks.pop(message.id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _edit_later(self, message_id):
+        await asyncio.sleep(self.window)
+        message, _ = self._pending[message_id]
+        channel_id = message.channel.id
+        lock = self._channel_locks.setdefault(channel_id, asyncio.Lock())
+        async with lock:
+            wait = self._channel_last_edit.get(channel_id, 0.0) + self.channel_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            # take whatever content is newest once it is our turn to send
+            message, content = self._pending.pop(message_id)
+            self._tasks.pop(message_id, None)
+            if self._sent.get(message_id) == content:
+                return
+            self._channel_last_edit[channel_id] = time.monotonic()
+            try:
+                await message.edit(content=content)
+                self._sent[message_id] = content
+            except discord.HTTPException as e:
+                log.warning(f'Start message edit failed: {e}', extra={'guild': message.guild.id if message.guild else None})
@@ -0,0 +1,80 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from metrics import STORAGE_LATENCY
+
+log = logging.getLogger('bot.executor')
+
+# threads running storage work (SQLite I/O and the rating updates around it)
+STORAGE_WORKERS = 4
+
+# processes running CPU-heavy work such as team balancing
+CPU_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# event-loop lag (seconds) worth printing a warning about
+LAG_WARNING = 0.25
+
+
+class Executor:
+    '''
+    Runs blocking work off the asyncio event loop.
+    Storage work goes to a thread pool and is serialized per guild, so two commands in
+    the same guild can never interleave a read-modify-write of its ratings. CPU-heavy
+    work goes to a process pool. Also measures how late the event loop wakes up.
+    '''
+
+    def __init__(self, storage_workers=STORAGE_WORKERS, cpu_workers=CPU_WORKERS):
+        self._threads = ThreadPoolExecutor(max_workers=storage_workers, thread_name_prefix='storage')
+        self._cpu_workers = cpu_workers
+        self._processes = None
+        # guild id -> asyncio.Lock serializing that guild's storage work
+        self._guild_locks = {}
+        self._monitor = None
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    async def storage(self, guildid, fn, *args, **kwargs):
+        '''
+        Runs fn(*args, **kwargs) on the storage thread pool after any earlier storage work of the same guild.
+        :return: fn's result
+        '''
+        def timed():
+            with STORAGE_LATENCY.time(fn.__name__):
+                return fn(*args, **kwargs)
+
+        lock = self._guild_locks.setdefault(int(guildid), asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._threads, timed)
+
+    async def cpu(self, fn, *args, **kwargs):
+        '''
+        Runs fn(*args, **kwargs) in the process pool. fn, its arguments and its result must be picklable.
+        :return: fn's result
+        '''
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self._cpu_workers)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._processes, functools.partial(fn, *args, **kwargs))
+
+    def start_lag_monitor(self, interval=0.5):
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.ensure_future(self._monitor_lag(interval))
+
+    async def _monitor_lag(self, interval):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            self.lag = max(0.0, time.monotonic() - start - interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            if self.lag > LAG_WARNING:
+                log.warning(f'Event loop lagging: {round(self.lag, 3)}s', extra={'duration': self.lag})
+
+    def shutdown(self):
+        self._threads.shutdown(wait=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=True)
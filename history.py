@@ -0,0 +1,257 @@
+import math
+import threading
+import time
+from array import array
+
+import trueskill as ts
+
+from storage import DB_PATH, connect
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    played_at REAL NOT NULL,
+    attackers BLOB NOT NULL,
+    defenders BLOB NOT NULL,
+    winner INTEGER NOT NULL,
+    undone INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS matches_by_guild ON matches (guild_id, id);
+CREATE TABLE IF NOT EXISTS baselines (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    mu REAL NOT NULL,
+    sigma REAL NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS baseline_guilds (
+    guild_id INTEGER PRIMARY KEY
+);
+'''
+
+# values of the winner column
+ATTACKERS_WON = 0
+DEFENDERS_WON = 1
+
+
+def _pack(userids):
+    return array('q', (int(userid) for userid in userids)).tobytes()
+
+
+def _unpack(blob):
+    team = array('q')
+    team.frombytes(blob)
+    return team.tolist()
+
+
+class MatchLog:
+    '''
+    Append-only log of recorded matches per guild.
+    Teams are stored as packed int64 user ids. Undoing a match only flags it, so
+    the full history stays auditable. Ratings a guild already had before its first
+    logged match are kept as a baseline that replays start from.
+    '''
+
+    def __init__(self, path=DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(SCHEMA)
+        self._baseline_guilds = {row[0] for row in self._conn.execute('SELECT guild_id FROM baseline_guilds')}
+
+    def has_baseline(self, guildid):
+        return int(guildid) in self._baseline_guilds
+
+    def set_baseline(self, guildid, ratings):
+        '''
+        :param ratings: dict of userid -> (mu, sigma) the guild had before its first logged match
+        '''
+        guildid = int(guildid)
+        with self._lock:
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                self._conn.execute('DELETE FROM baselines WHERE guild_id = ?', (guildid,))
+                self._conn.executemany('INSERT INTO baselines (guild_id, user_id, mu, sigma) VALUES (?, ?, ?, ?)',
+                                       ((guildid, int(userid), mu, sigma) for userid, (mu, sigma) in ratings.items()))
+                self._conn.execute('INSERT OR IGNORE INTO baseline_guilds (guild_id) VALUES (?)', (guildid,))
+            self._baseline_guilds.add(guildid)
+
+    def baseline(self, guildid):
+        '''
+        :return: dict of userid -> (mu, sigma)
+        '''
+        with self._lock:
+            rows = self._conn.execute('SELECT user_id, mu, sigma FROM baselines WHERE guild_id = ?', (int(guildid),))
+            return {userid: (mu, sigma) for userid, mu, sigma in rows}
+
+    def clear(self, guildid):
+        '''
+        Deletes a guild's whole history and baseline.
+        '''
+        guildid = int(guildid)
+        with self._lock:
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                for table in ('matches', 'baselines', 'baseline_guilds'):
+                    self._conn.execute(f'DELETE FROM {table} WHERE guild_id = ?', (guildid,))
+            self._baseline_guilds.discard(guildid)
+
+    def append(self, guildid, attackers, defenders, winner, played_at=None):
+        '''
+        :param winner: ATTACKERS_WON or DEFENDERS_WON
+        :return: id of the logged match
+        '''
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT INTO matches (guild_id, played_at, attackers, defenders, winner) VALUES (?, ?, ?, ?, ?)',
+                (int(guildid), played_at if played_at is not None else time.time(), _pack(attackers), _pack(defenders), winner))
+            return cursor.lastrowid
+
+    def append_many(self, guildid, matches):
+        '''
+        :param matches: iterable of (attackers, defenders, winner, played_at)
+        '''
+        with self._lock:
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                self._conn.executemany(
+                    'INSERT INTO matches (guild_id, played_at, attackers, defenders, winner) VALUES (?, ?, ?, ?, ?)',
+                    ((int(guildid), played_at, _pack(attackers), _pack(defenders), winner)
+                     for attackers, defenders, winner, played_at in matches))
+
+    def matches(self, guildid):
+        '''
+        Streams a guild's matches that have not been undone, oldest first.
+        :return: iterator of (winning team, losing team) lists of userids
+        '''
+        return unpack_matches(self.rows(guildid))
+
+    def rows(self, guildid, exclude=()):
+        '''
+        :param exclude: ids of matches to leave out, as if they were undone
+        :return: list of packed (attackers, defenders, winner) rows of the guild's matches that have not
+            been undone, oldest first; cheap to send to another process, see unpack_matches
+        '''
+        exclude = list(exclude)
+        query = 'SELECT attackers, defenders, winner FROM matches WHERE guild_id = ? AND undone = 0'
+        if exclude:
+            query += f" AND id NOT IN ({', '.join('?' * len(exclude))})"
+        with self._lock:
+            return self._conn.execute(query + ' ORDER BY id', (int(guildid), *exclude)).fetchall()
+
+    def version(self, guildid):
+        '''
+        :return: value that changes whenever a match of the guild is appended or undone
+        '''
+        with self._lock:
+            return tuple(self._conn.execute('SELECT COUNT(*), MAX(id) FROM matches WHERE guild_id = ? AND undone = 0',
+                                            (int(guildid),)).fetchone())
+
+    def count(self, guildid):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM matches WHERE guild_id = ? AND undone = 0',
+                                      (int(guildid),)).fetchone()[0]
+
+    def last_ids(self, guildid, n=1):
+        '''
+        :return: ids of the guild's last n matches that have not been undone, newest first
+        '''
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                'SELECT id FROM matches WHERE guild_id = ? AND undone = 0 ORDER BY id DESC LIMIT ?', (int(guildid), n))]
+
+    def undo(self, ids, conn=None):
+        '''
+        Flags matches as undone.
+        :param ids: match ids, e.g. from last_ids
+        :param conn: connection to the same database with a write transaction in progress to run in
+            (see RatingStore.replace), instead of committing on its own
+        '''
+        if conn is not None:
+            conn.executemany('UPDATE matches SET undone = 1 WHERE id = ?', ((id,) for id in ids))
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                self._conn.executemany('UPDATE matches SET undone = 1 WHERE id = ?', ((id,) for id in ids))
+
+    def undo_last(self, guildid, n=1):
+        '''
+        Flags the guild's last n matches as undone.
+        :return: number of matches undone
+        '''
+        with self._lock:
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                ids = [row[0] for row in self._conn.execute(
+                    'SELECT id FROM matches WHERE guild_id = ? AND undone = 0 ORDER BY id DESC LIMIT ?', (int(guildid), n))]
+                self._conn.executemany('UPDATE matches SET undone = 1 WHERE id = ?', ((id,) for id in ids))
+        return len(ids)
+
+
+def unpack_matches(rows):
+    '''
+    :param rows: packed rows from MatchLog.rows
+    :return: iterator of (winning team, losing team) lists of userids
+    '''
+    for attackers, defenders, winner in rows:
+        if winner == ATTACKERS_WON:
+            yield _unpack(attackers), _unpack(defenders)
+        else:
+            yield _unpack(defenders), _unpack(attackers)
+
+
+def env_settings(env):
+    '''
+    :return: picklable settings that recreate a TrueSkill environment with ts.TrueSkill(**settings)
+    '''
+    return {'mu': env.mu, 'sigma': env.sigma, 'beta': env.beta, 'tau': env.tau, 'draw_probability': env.draw_probability}
+
+
+def replay_rows(rows, settings, initial=None):
+    '''
+    replay for the process pool: environments can't be pickled, so it takes their settings,
+    and the matches stay packed until they reach the worker.
+    :param rows: packed rows from MatchLog.rows
+    :param settings: from env_settings
+    '''
+    return replay(unpack_matches(rows), ts.TrueSkill(**settings), initial)
+
+
+def replay(matches, env=None, initial=None):
+    '''
+    Recomputes ratings from scratch in a single pass over a match history.
+    Uses the closed-form TrueSkill update for two teams without a draw, which gives
+    the same result as env.rate([winners, losers], [0, 1]) without building a factor graph.
+    :param matches: iterable of (winning team, losing team) lists of userids, oldest first
+    :param env: TrueSkill environment, defaults to the global one
+    :param initial: dict of userid -> (mu, sigma) to start from instead of default ratings
+    :return: dict of userid -> (mu, sigma)
+    '''
+    env = env or ts.global_env()
+    beta_sq = env.beta ** 2
+    tau_sq = env.tau ** 2
+    default = (env.mu, env.sigma ** 2)
+    # userid -> [mu, sigma^2]
+    ratings = {id: [mu, sigma ** 2] for id, (mu, sigma) in (initial or {}).items()}
+    margins = {}
+    for winners, losers in matches:
+        players = winners + losers
+        size = len(players)
+        if size not in margins:
+            margins[size] = ts.calc_draw_margin(env.draw_probability, size, env)
+        states = [ratings.get(id) or list(default) for id in players]
+        for state in states:
+            state[1] += tau_sq
+        c_sq = size * beta_sq + sum(state[1] for state in states)
+        c = math.sqrt(c_sq)
+        diff = sum(state[0] for state in states[:len(winners)]) - sum(state[0] for state in states[len(winners):])
+        v = env.v_win(diff / c, margins[size] / c)
+        w = env.w_win(diff / c, margins[size] / c)
+        for index, (id, state) in enumerate(zip(players, states)):
+            sign = 1.0 if index < len(winners) else -1.0
+            variance = state[1]
+            state[0] += sign * variance / c * v
+            state[1] = variance * (1 - variance / c_sq * w)
+            ratings[id] = state
+    return {id: (mu, math.sqrt(variance)) for id, (mu, variance) in ratings.items()}
@@ -1,15 +1,31 @@
-from flask import Flask
+import os
+from flask import Flask, Response, abort, request
 from threading import Thread
 
+from metrics import registry, sample_profile
+
 app = Flask('')
 
 @app.route('/')
 def home():
   return 'Hello. I am alive!'
 
+@app.route('/metrics')
+def metrics():
+  return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile')
+def profile():
+  # opt-in: sampling every thread's stack is not something to expose by default
+  if os.getenv('ENABLE_PROFILING') != '1':
+    abort(404)
+  seconds = request.args.get('seconds', default=10, type=float)
+  return Response(sample_profile(seconds), mimetype='text/plain')
+
 def run():
-  app.run(host = '0.0.0.0', port=8080)
+  # each shard process of launcher.py gets its own PORT
+  app.run(host = '0.0.0.0', port=int(os.getenv('PORT', 8080)))
 
 def keep_alive():
-  t = Thread(target=run)
-  t.start()
\ No newline at end of file
+  t = Thread(target=run, daemon=True)
+  t.start()
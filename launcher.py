@@ -0,0 +1,157 @@
+'''
+Runs the bot as several processes, each connected to its own subset of gateway shards,
+and restarts any process that exits. All processes share the SQLite database.
+
+    SHARD_COUNT=16 PROCESSES=4 python launcher.py
+
+SHARD_COUNT defaults to the count Discord recommends for the bot, PROCESSES to the
+number of CPUs. Process i serves its /metrics on PORT + i and logs to discord-<i>.log.
+'''
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import discord
+
+from logconfig import LOG_FILE, setup_logging
+
+# seconds Discord wants between two shard IDENTIFYs
+IDENTIFY_INTERVAL = 5.0
+
+# restart delay after a crash, doubled for every crash in a row
+RESTART_BACKOFF = 5.0
+MAX_RESTART_BACKOFF = 300.0
+
+# a process that ran this long is considered healthy again
+HEALTHY_UPTIME = 60.0
+
+# seconds to wait for processes to exit on shutdown before killing them
+SHUTDOWN_TIMEOUT = 10.0
+
+# the bot script, found next to this file whatever the working directory
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+log = logging.getLogger('bot.launcher')
+
+
+async def recommended_shards(token):
+    '''
+    :return: the shard count Discord recommends for the bot
+    '''
+    http = discord.http.HTTPClient()
+    try:
+        await http.static_login(token, bot=True)
+        shard_count, _ = await http.get_bot_gateway()
+    finally:
+        await http.close()
+    return shard_count
+
+
+def partition(shard_count, processes):
+    '''
+    Splits shard ids 0..shard_count-1 into contiguous, evenly sized groups.
+    :return: list of shard id lists, one per process
+    '''
+    processes = max(1, min(processes, shard_count))
+    return [list(range(i * shard_count // processes, (i + 1) * shard_count // processes)) for i in range(processes)]
+
+
+class ShardProcess:
+    '''
+    One bot process running main.py for a group of shards.
+    '''
+
+    def __init__(self, index, shard_ids, shard_count, port):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.port = port
+        self.proc = None
+        self.started_at = 0.0
+        self.crashes = 0
+        # time.monotonic() at which a crashed process may be started again
+        self.restart_at = 0.0
+
+    def start(self):
+        root, ext = os.path.splitext(LOG_FILE)
+        env = dict(os.environ,
+                   SHARD_COUNT=str(self.shard_count),
+                   SHARD_IDS=','.join(map(str, self.shard_ids)),
+                   PORT=str(self.port),
+                   LOG_FILE=f'{root}-{self.index}{ext}')
+        self.proc = subprocess.Popen([sys.executable, MAIN], env=env)
+        self.started_at = time.monotonic()
+        log.info(f'Started process {self.index} (pid {self.proc.pid}) for shards {self.shard_ids}')
+
+    def check(self):
+        '''
+        Schedules a restart if the process has exited, and starts it once its backoff has passed.
+        '''
+        if self.proc is not None:
+            code = self.proc.poll()
+            if code is None:
+                return
+            uptime = time.monotonic() - self.started_at
+            self.crashes = 1 if uptime >= HEALTHY_UPTIME else self.crashes + 1
+            delay = min(MAX_RESTART_BACKOFF, RESTART_BACKOFF * 2 ** (self.crashes - 1))
+            log.warning(f'Process {self.index} exited with code {code} after {round(uptime)}s, restarting in {delay}s')
+            self.proc = None
+            self.restart_at = time.monotonic() + delay
+        if time.monotonic() >= self.restart_at:
+            self.start()
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+    def wait(self, timeout):
+        if self.proc is None:
+            return
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+
+def run(shard_count, processes, base_port):
+    groups = partition(shard_count, processes)
+    workers = [ShardProcess(i, shard_ids, shard_count, base_port + i) for i, shard_ids in enumerate(groups)]
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # stagger the first start so processes don't IDENTIFY at the same time
+    delay = 0.0
+    for worker in workers:
+        worker.restart_at = time.monotonic() + delay
+        delay += IDENTIFY_INTERVAL * len(worker.shard_ids)
+
+    log.info(f'Running {shard_count} shards in {len(workers)} processes')
+    while not stopping:
+        for worker in workers:
+            worker.check()
+        time.sleep(1.0)
+
+    log.info('Stopping shard processes')
+    for worker in workers:
+        worker.stop()
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    for worker in workers:
+        worker.wait(max(0.0, deadline - time.monotonic()))
+
+
+if __name__ == '__main__':
+    setup_logging()
+    shard_count = os.getenv('SHARD_COUNT')
+    shard_count = int(shard_count) if shard_count else asyncio.run(recommended_shards(os.getenv('TOKEN')))
+    processes = int(os.getenv('PROCESSES', os.cpu_count() or 1))
+    run(shard_count, processes, int(os.getenv('PORT', 8080)))
@@ -0,0 +1,70 @@
+from sortedcontainers import SortedList
+
+# players shown per leaderboard page
+PAGE_SIZE = 15
+
+
+class LeaderboardIndex:
+    '''
+    Sorted index of a guild's ratings, best first: highest mu, then lowest sigma.
+    Updates, rank lookups and page reads are all O(log n) (plus the page length),
+    so nothing has to be re-sorted on $leaderboard.
+    '''
+
+    def __init__(self, ratings=None):
+        '''
+        :param ratings: dict of userid -> (mu, sigma) to start from
+        '''
+        ratings = {int(userid): (mu, sigma) for userid, (mu, sigma) in (ratings or {}).items()}
+        self._ratings = ratings
+        self._entries = SortedList((-mu, sigma, userid) for userid, (mu, sigma) in ratings.items())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, userid):
+        return int(userid) in self._ratings
+
+    def update(self, userid, mu, sigma):
+        userid = int(userid)
+        self.remove(userid)
+        self._ratings[userid] = mu, sigma
+        self._entries.add((-mu, sigma, userid))
+
+    def remove(self, userid):
+        userid = int(userid)
+        old = self._ratings.pop(userid, None)
+        if old is not None:
+            self._entries.remove((-old[0], old[1], userid))
+
+    def rank(self, userid):
+        '''
+        :return: 1-based rank of userid, shared by players with identical ratings, or None if unranked
+        '''
+        rating = self._ratings.get(int(userid))
+        if rating is None:
+            return None
+        mu, sigma = rating
+        return self._entries.bisect_left((-mu, sigma)) + 1
+
+    def page(self, start=0, count=PAGE_SIZE):
+        '''
+        :param start: 0-based position of the first entry
+        :return: list of (rank, userid, mu, sigma) tuples
+        '''
+        start = max(start, 0)
+        result = []
+        for neg_mu, sigma, userid in self._entries.islice(start, start + count):
+            result.append((self.rank(userid), userid, -neg_mu, sigma))
+        return result
+
+    def around(self, userid, count=PAGE_SIZE):
+        '''
+        :return: page of entries centered on userid, or an empty list if userid is unranked;
+            near either end of the leaderboard the page is shifted so it stays full
+        '''
+        rating = self._ratings.get(int(userid))
+        if rating is None:
+            return []
+        position = self._entries.index((-rating[0], rating[1], int(userid)))
+        return self.page(min(position - count // 2, len(self._entries) - count), count)
@@ -0,0 +1,73 @@
+import time
+
+# seconds after which an unfinished lobby is considered abandoned
+LOBBY_TTL = 6 * 60 * 60
+
+
+class Lobby:
+    '''
+    Roster of players reacting to a guild's $start message.
+    Kept up to date incrementally from raw reaction events so matchmaking never has
+    to page through the message's reactions over HTTP. The roster is rebuilt from the
+    API only when it may have missed events (reconnects, or a removal it never saw added).
+    '''
+
+    def __init__(self, message):
+        self.message = message
+        self.message_id = message.id
+        self.channel_id = message.channel.id
+        # userid -> set of emoji the user reacted with
+        self.reactions = {}
+        # a freshly sent message has no reactions, so it starts in sync
+        self.stale = False
+        self.started_at = time.monotonic()
+
+    @property
+    def expired(self):
+        return time.monotonic() - self.started_at > LOBBY_TTL
+
+    @property
+    def players(self):
+        return list(self.reactions)
+
+    def add(self, userid, emoji):
+        '''
+        Records a reaction.
+        :return: True if the player list changed
+        '''
+        emojis = self.reactions.setdefault(userid, set())
+        new_player = not emojis
+        emojis.add(str(emoji))
+        return new_player
+
+    def remove(self, userid, emoji):
+        '''
+        Records a removed reaction. Removing a reaction that was never seen means
+        events were missed, so the lobby is marked stale.
+        :return: True if the player list changed
+        '''
+        emojis = self.reactions.get(userid)
+        if emojis is None or str(emoji) not in emojis:
+            self.stale = True
+            return False
+        emojis.discard(str(emoji))
+        if not emojis:
+            del self.reactions[userid]
+            return True
+        return False
+
+    async def sync(self, channel):
+        '''
+        Rebuilds the roster from the message's current reactions.
+        '''
+        message = await channel.fetch_message(self.message_id)
+        reactions = {}
+        for reaction in message.reactions:
+            async for user in reaction.users():
+                reactions.setdefault(user.id, set()).add(str(reaction.emoji))
+        self.reactions = reactions
+        self.stale = False
+
+    def roster_message(self):
+        players = self.players
+        return "React to this message if you're playing" + f' ({len(players)})' + ''.join([f'\t<@!{member}>' for member in players])
@@ -0,0 +1,77 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# level of the bot's own loggers ('bot.*')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+# level of discord.py's loggers; DEBUG logs every gateway event
+DISCORD_LOG_LEVEL = os.getenv('DISCORD_LOG_LEVEL', 'INFO')
+
+LOG_FILE = os.getenv('LOG_FILE', 'discord.log')
+
+# size-based rotation, unless LOG_ROTATE_WHEN (e.g. 'midnight') asks for time-based rotation
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 2 ** 20))
+LOG_BACKUPS = int(os.getenv('LOG_BACKUPS', 5))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN')
+
+# extra record fields appended to every line when present
+STRUCTURED_FIELDS = ('guild', 'command', 'duration')
+
+
+class StructuredFormatter(logging.Formatter):
+    '''
+    Appends the structured fields of a record as key=value pairs, e.g.
+    log.info('Rated game created', extra={'guild': guild.id, 'command': 'rated', 'duration': 0.012})
+    '''
+
+    def format(self, record):
+        line = super().format(record)
+        fields = []
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is None:
+                continue
+            if isinstance(value, float):
+                value = round(value, 4)
+            fields.append(f'{field}={value}')
+        return line + (' ' + ' '.join(fields) if fields else '')
+
+
+_listener = None
+
+
+def setup_logging():
+    '''
+    Routes the 'bot' and 'discord' loggers through a queue to a background thread,
+    which does the actual file and console writes, so logging never blocks the event loop.
+    The log file is rotated instead of being truncated on every restart.
+    '''
+    global _listener
+    if _listener is not None:
+        return
+    formatter = StructuredFormatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s')
+    if LOG_ROTATE_WHEN:
+        file_handler = logging.handlers.TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS, encoding='utf-8')
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+    # only the bot's own records go to the console, like the prints they replace
+    console_handler.addFilter(logging.Filter('bot'))
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    for name, level in (('bot', LOG_LEVEL), ('discord', DISCORD_LOG_LEVEL)):
+        logger = logging.getLogger(name)
+        logger.setLevel(level.upper())
+        logger.addHandler(queue_handler)
+        logger.propagate = False
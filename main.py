@@ -1,53 +1,114 @@
+import asyncio
 import discord
 import os
 import random
-import shelve
 import trueskill as ts
 import logging
 import time
 
-# set up logging
-logger = logging.getLogger('discord')
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(handler)
+from balance import balance_matches, balance_teams
+from cache import RatingsCache
+from channels import ATTACKERS, CATEGORY, DEFENDERS, ChannelRegistry, match_kind
+from commands import CommandRouter
+from edits import EditCoalescer
+from executor import Executor
+from history import ATTACKERS_WON, DEFENDERS_WON, MatchLog, env_settings, replay_rows
+from keep_alive import keep_alive
+from leaderboard import LeaderboardIndex, PAGE_SIZE
+from lobby import Lobby
+from logconfig import setup_logging
+from metrics import instrument_http, registry
+from shards import GuildMap, shard_config
+from storage import MigrationError, RatingStore
+from voice import move_members
+
+# set up logging (queued, written by a background thread)
+setup_logging()
+log = logging.getLogger('bot')
 
 # global userid lists
 ADMINS = [335828416412778496, 263745246821744640]
 
+# players per team when $matches splits a lobby into several matches
+MATCH_TEAM_SIZE = 5
+
+# longest message Discord accepts
+MESSAGE_LIMIT = 2000
+
+# seconds between sweeps that close abandoned $start lobbies
+LOBBY_SWEEP_INTERVAL = 10 * 60
+
 # VALORANT MAPS
 VALORANT_MAP_POOL = ['Bind', 'Haven', 'Split', 'Ascent', 'Icebox', 'Breeze']
 
-# discord py client
+# discord py client; SHARD_COUNT/SHARD_IDS pick the shards this process runs (see launcher.py)
 intents = discord.Intents.default()
 intents.members = True
-client = discord.Client(intents=intents)
+shard_count, shard_ids = shard_config()
+client = discord.AutoShardedClient(intents=intents, shard_count=shard_count, shard_ids=shard_ids)
+
+# $command dispatch
+router = CommandRouter(admins=ADMINS)
 
-# dicts for guild-local variables
-guild_to_start_msg = {}
-guild_to_teams = {}
+# guild-local variables, partitioned by shard
+guild_to_lobby = GuildMap(lambda: client.shard_count)
+# guild id -> list of matches, each {'attackers': [userids], 'defenders': [userids], 'recorded': bool}
+guild_to_teams = GuildMap(lambda: client.shard_count)
+
+# task closing abandoned lobbies, started in on_ready
+lobby_sweeper = None
+
+# batches start message edits during reaction bursts
+start_msg_editor = EditCoalescer()
 
 # TrueSkill Rating Settings
 env = ts.TrueSkill(draw_probability=0.05)
 env.make_as_global()
 
 # TrueSkill DB cache
-ratings_cache = {}
+ratings_cache = RatingsCache()
+
+# sorted leaderboard index per guild, built on first $leaderboard
+leaderboards = GuildMap(lambda: client.shard_count)
+
+# persistent rating storage (migrates old <guildid>.db shelve files on first use)
+store = RatingStore()
+
+# append-only log of recorded matches, used to undo results and rerate
+match_log = MatchLog()
+
+# thread pool for storage, process pool for balancing
+executor = Executor()
+
+# category and voice channels created by the bot, per guild
+channel_registry = ChannelRegistry()
+
+# operational metrics served by keep_alive at /metrics
+instrument_http(client.http)
+registry.gauge('bot_event_loop_lag_seconds', 'Latest event loop wake-up delay.', lambda: executor.lag)
+registry.gauge('bot_event_loop_max_lag_seconds', 'Largest event loop wake-up delay seen.', lambda: executor.max_lag)
+registry.gauge('bot_ratings_cache_hit_ratio', 'Ratings cache hit rate.', lambda: ratings_cache.stats()['hit_rate'])
+registry.gauge('bot_ratings_cache_hits_total', 'Ratings cache hits.', lambda: ratings_cache.hits, kind='counter')
+registry.gauge('bot_ratings_cache_misses_total', 'Ratings cache misses.', lambda: ratings_cache.misses, kind='counter')
+registry.gauge('bot_ratings_cache_evictions_total', 'Ratings evicted from the cache.', lambda: ratings_cache.evictions, kind='counter')
+registry.gauge('bot_ratings_cache_size', 'Ratings held in the cache.', lambda: len(ratings_cache))
+registry.gauge('bot_active_lobbies', 'Open $start lobbies that are not yet finished or abandoned.', lambda: sum(not lobby.expired for lobby in guild_to_lobby.values()))
+registry.gauge('bot_guilds', 'Guilds the bot is in.', lambda: len(client.guilds))
+registry.gauge('bot_shards', 'Gateway shards run by this process.', lambda: len(client.shards))
 
 # TrueSkill DB helper functions
 def clear_db(guildid):
-    with shelve.open(str(guildid)) as db:
-        for id in db.keys():
-            del db[id]
-
-def db_string(guildid):
-    output = []
-    with shelve.open(str(guildid)) as db:
-        for id in db.keys():
-            output.append(id)
-            output.append(str(db[id]))
-    return ' '.join(output)
+    store.clear(guildid)
+    match_log.clear(guildid)
+    ratings_cache.drop_guild(guildid)
+    leaderboards.pop(int(guildid), None)
+
+def warm_cache(guildid):
+    '''
+    Loads every stored rating of a guild into the cache so matchmaking never reads from disk.
+    '''
+    stored = store.all(guildid)
+    ratings_cache.warm_load(guildid, {id : ts.Rating(mu, sigma) for id, (mu, sigma) in stored.items()})
 
 def get_skill(userid, guildid):
     '''
@@ -56,42 +117,55 @@ def get_skill(userid, guildid):
     :param userid: Discord userid to find
     :return: stored TrueSkill rating object of userid
     '''
-    userid = str(userid)
-    guildid = str(guildid)
-
     # check cache first
-    if guildid not in ratings_cache:
-            ratings_cache[guildid] = {}
-    if userid in ratings_cache[guildid]:
-        return ratings_cache[guildid][userid]
+    rating = ratings_cache.get(guildid, userid)
+    if rating is not None:
+        return rating
     
-    print(f'Cache Miss: guildid = {guildid} userid = {userid}')
-
-    with shelve.open(str(guildid), writeback=True) as db:
-        if 'ratings' not in db:
-            db['ratings'] = {}
-        ratings = db['ratings']
-        if userid in ratings:
-            mu, sigma = ratings[userid]
-            return ts.Rating(float(mu), float(sigma))
-        new_rating = ts.Rating()
-        ratings_cache[guildid][userid] = new_rating
-        ratings[userid] = new_rating.mu, new_rating.sigma
-        db['ratings'][userid] = new_rating.mu, new_rating.sigma
-        return new_rating
+    log.debug(f'Cache miss for {userid}', extra={'guild': guildid})
+
+    stored = store.get(guildid, userid)
+    if stored is not None:
+        rating = ts.Rating(float(stored[0]), float(stored[1]))
+    else:
+        rating = ts.Rating()
+        store.set(guildid, userid, rating.mu, rating.sigma)
+        update_leaderboard(guildid, {userid : rating})
+    ratings_cache.put(guildid, userid, rating)
+    return rating
 
 def set_rating(userid, rating, guildid):
-    userid = str(userid)
-    guildid = str(guildid)
     # write to cache
-    if guildid not in ratings_cache:
-            ratings_cache[guildid] = {}
-    ratings_cache[guildid][userid] = rating
-    # write to shelve persistent db
-    with shelve.open(str(guildid), writeback=True) as db:
-        if 'ratings' not in db:
-            db['ratings'] = {}
-        db['ratings'][userid] = rating.mu, rating.sigma
+    ratings_cache.put(guildid, userid, rating)
+    # write to persistent db
+    store.set(guildid, userid, rating.mu, rating.sigma)
+    update_leaderboard(guildid, {userid : rating})
+
+def get_skills(userids, guildid):
+    '''
+    Returns the TrueSkill ratings of a whole lobby, reading every cache miss from storage in one lookup.
+    Will initialize skill for players that have none.
+    :return: dict of userid -> TrueSkill rating for every userid
+    '''
+    ratings = {}
+    missing = []
+    for id in userids:
+        rating = ratings_cache.get(guildid, id)
+        if rating is not None:
+            ratings[id] = rating
+        else:
+            missing.append(id)
+    if missing:
+        stored = store.get_many(guildid, missing)
+        loaded = {id : ts.Rating(*stored[int(id)]) for id in missing if int(id) in stored}
+        new = {id : ts.Rating() for id in missing if int(id) not in stored}
+        if new:
+            store.set_many(guildid, {id : (rating.mu, rating.sigma) for id, rating in new.items()})
+            update_leaderboard(guildid, new)
+        ratings_cache.put_many(guildid, {**loaded, **new})
+        ratings.update(loaded)
+        ratings.update(new)
+    return {id : ratings[id] for id in userids}
 
 def record_result(winning_team, losing_team, guildid):
     '''
@@ -103,355 +177,600 @@ def record_result(winning_team, losing_team, guildid):
     winning_team_ratings = {id : get_skill(id, guildid) for id in winning_team}
     losing_team_ratings = {id : get_skill(id, guildid) for id in losing_team}
     winning_team_ratings_new, losing_team_ratings_new = ts.rate([winning_team_ratings, losing_team_ratings], [0,1])
-    with shelve.open(str(guildid), writeback=True) as db:
-        ratings = db['ratings']
-        for id in winning_team_ratings:
-            ratings_cache[str(guildid)][str(id)] = winning_team_ratings_new[id]
-            ratings[str(id)] = winning_team_ratings_new[id].mu, winning_team_ratings_new[id].sigma
-        for id in losing_team_ratings:
-            ratings_cache[str(guildid)][str(id)] = losing_team_ratings_new[id]
-            ratings[str(id)] = losing_team_ratings_new[id].mu, losing_team_ratings_new[id].sigma
-        return winning_team_ratings, losing_team_ratings, winning_team_ratings_new, losing_team_ratings_new
-
-def make_teams(players, guildid, pool=10):
+    # write all changed ratings in one batch
+    changed = {**winning_team_ratings_new, **losing_team_ratings_new}
+    ratings_cache.put_many(guildid, changed)
+    update_leaderboard(guildid, changed)
+    store.set_many(guildid, {id : (rating.mu, rating.sigma) for id, rating in changed.items()})
+    return winning_team_ratings, losing_team_ratings, winning_team_ratings_new, losing_team_ratings_new
+
+def record_match(attackers, defenders, winner, guildid):
+    '''
+    Rates a match and appends it to the guild's match log.
+    :param winner: ATTACKERS_WON or DEFENDERS_WON
+    :return: same as record_result, winning team first
+    '''
+    # ratings from before match logging started are what replays begin from
+    if not match_log.has_baseline(guildid):
+        match_log.set_baseline(guildid, store.all(guildid))
+    if winner == ATTACKERS_WON:
+        result = record_result(attackers, defenders, guildid)
+    else:
+        result = record_result(defenders, attackers, guildid)
+    match_log.append(guildid, attackers, defenders, winner)
+    return result
+
+def read_history(guildid, undo=()):
+    '''
+    :param undo: ids of matches to leave out, as if they were undone
+    :return: match log version, packed matches, baseline ratings
+    '''
+    return match_log.version(guildid), match_log.rows(guildid, exclude=undo), match_log.baseline(guildid)
+
+def replace_ratings(guildid, ratings, version, undo=()):
+    '''
+    Replaces every stored rating of a guild, unless matches were recorded or undone since version.
+    The matches in undo are flagged undone in the same transaction, so they stay recorded if this fails.
+    :return: True if the ratings were replaced
+    '''
+    if match_log.version(guildid) != version:
+        return False
+    store.replace(guildid, ratings, in_transaction=lambda conn: match_log.undo(undo, conn) if undo else None)
+    ratings_cache.drop_guild(guildid)
+    leaderboards.pop(int(guildid), None)
+    return True
+
+async def rerate(guildid, undo=0):
+    '''
+    Recomputes every rating of a guild by replaying its match log with the current TrueSkill settings.
+    The log is read on a storage thread and replayed in the process pool; if a result is recorded
+    meanwhile, the replay is repeated so it is not overwritten.
+    :param undo: number of most recent matches to undo first
+    :return: number of matches undone, number of matches replayed
+    '''
+    undone = await executor.storage(guildid, match_log.last_ids, guildid, undo) if undo else []
+    while True:
+        version, rows, baseline = await executor.storage(guildid, read_history, guildid, undone)
+        ratings = await executor.cpu(replay_rows, rows, env_settings(env), baseline)
+        if await executor.storage(guildid, replace_ratings, guildid, ratings, version, undone):
+            return len(undone), len(rows)
+
+async def make_teams(players, guildid):
     '''
     Make teams based on rating.
+    Ratings are read on the storage threads and balancing runs in the process pool.
     :param players: list of userid of participating players
-    :param pool: number of matches to generate from which the best is chosen
-    :return: t (list of userids), ct (list of userids), predicted quality of match
-    '''
-    player_ratings = {id : get_skill(id, guildid) for id in players}
-    t = ct = []
-    best_quality = 0.0
-    for i in range(pool):
-        random.shuffle(players)
-        team_size = len(players) // 2
-        t1 = {id : player_ratings[id] for id in players[:team_size]}
-        t2 = {id : player_ratings[id] for id in players[team_size:]}
-        quality = ts.quality([t1, t2])
-        if quality > best_quality:
-            t = list(t1.keys())
-            ct = list(t2.keys())
-            best_quality = quality
-    return t, ct, best_quality
-
-def get_leaderboard(guildid):
-    '''
-    Gets list of userids and TrueSkill ratings, sorted by current rating
-    :return: list of (userid, TrueSkill.Rating) tuples, sorted by rating
-    '''
-    with shelve.open(str(guildid), writeback=True) as db:
-        if 'ratings' in db:
-            ratings = {id : ts.TrueSkill(db['ratings'][id][0], db['ratings'][id][1]) for id in db['ratings']}
-            #ratings = {id : get_skill(id, guildid) for id in db['ratings'].keys()}
-            return sorted(ratings.items(), key=lambda x: (x[1].mu, -x[1].sigma), reverse=True)
-        return None
+    :return: t (list of userids), ct (list of userids), predicted quality of match, dict of userid -> rating
+    '''
+    player_ratings = await executor.storage(guildid, get_skills, players, guildid)
+    t, ct, quality = (await executor.cpu(balance_teams, player_ratings))[0]
+    return t, ct, quality, player_ratings
+
+def get_leaderboard(guild):
+    '''
+    Gets the sorted leaderboard index of a guild, building it from storage on first use.
+    Only current members of the guild are ranked.
+    :return: LeaderboardIndex of the guild's players
+    '''
+    if guild.id not in leaderboards:
+        stored = store.all(guild.id)
+        leaderboards[guild.id] = LeaderboardIndex({id : rating for id, rating in stored.items() if guild.get_member(id)})
+    return leaderboards[guild.id]
+
+def read_leaderboard(guild, page=1, userid=None):
+    '''
+    Reads one page of a guild's leaderboard.
+    :param page: 1-based page number
+    :param userid: if given, read the page centered on this user instead
+    :return: number of ranked players, list of (rank, userid, mu, sigma) tuples
+    '''
+    leaderboard = get_leaderboard(guild)
+    if userid is not None:
+        return len(leaderboard), leaderboard.around(userid)
+    return len(leaderboard), leaderboard.page((max(page, 1) - 1) * PAGE_SIZE)
+
+def update_leaderboard(guildid, ratings):
+    '''
+    Applies changed ratings to the guild's leaderboard index if it has been built.
+    :param ratings: dict of userid -> TrueSkill.Rating
+    '''
+    leaderboard = leaderboards.get(int(guildid))
+    if leaderboard is not None:
+        for id, rating in ratings.items():
+            leaderboard.update(id, rating.mu, rating.sigma)
+
+def close_lobby(guildid, lobby=None):
+    '''
+    Forgets a guild's $start lobby once it is finished, so it is no longer re-synced or pinned in the cache.
+    :param lobby: only close the guild's lobby if it is still this one
+    '''
+    current = guild_to_lobby.get(guildid)
+    if current is None or (lobby is not None and current is not lobby):
+        return
+    del guild_to_lobby[guildid]
+    start_msg_editor.discard(current.message)
+    ratings_cache.unpin(guildid)
+
+async def sweep_lobbies():
+    '''
+    Closes expired lobbies every LOBBY_SWEEP_INTERVAL, so guilds that never finish a
+    lobby don't stay pinned in the ratings cache.
+    '''
+    while True:
+        await asyncio.sleep(LOBBY_SWEEP_INTERVAL)
+        for guildid, lobby in guild_to_lobby.items():
+            if lobby.expired:
+                close_lobby(guildid, lobby)
+                log.debug('Closed expired lobby', extra={'guild': guildid})
+
+async def sync_lobby(guildid, lobby):
+    '''
+    Re-reads a lobby's reactions from the API and refreshes its start message.
+    Abandoned lobbies and lobbies whose start message is gone are closed instead.
+    '''
+    channel = client.get_channel(lobby.channel_id)
+    if channel is None or lobby.expired:
+        close_lobby(guildid, lobby)
+        return
+    try:
+        await lobby.sync(channel)
+    except discord.NotFound:
+        close_lobby(guildid, lobby)
+        return
+    except discord.HTTPException as e:
+        log.warning(f'Lobby sync failed: {e}', extra={'guild': guildid})
+        return
+    start_msg_editor.schedule(lobby.message, lobby.roster_message())
 
 @client.event
 async def on_ready():
-    print('Logged in as {0.user}'.format(client))
+    log.info(f'Logged in as {client.user} running shards {sorted(client.shards)} of {client.shard_count}')
+    executor.start_lag_monitor()
+    # on_ready runs again after reconnects, keep a single sweeper
+    global lobby_sweeper
+    if lobby_sweeper is None or lobby_sweeper.done():
+        lobby_sweeper = asyncio.ensure_future(sweep_lobbies())
+
+@client.event
+async def on_shard_ready(shard_id):
+    log.info(f'Shard {shard_id} ready')
+    # reaction events may have been missed while the shard was disconnected
+    for guildid, lobby in list(guild_to_lobby.shard(shard_id).items()):
+        await sync_lobby(guildid, lobby)
+
+@client.event
+async def on_shard_resumed(shard_id):
+    for guildid, lobby in list(guild_to_lobby.shard(shard_id).items()):
+        if lobby.stale or lobby.expired:
+            await sync_lobby(guildid, lobby)
 
 @client.event
 async def on_raw_reaction_add(payload):
     # update start message with reactors
-    if payload.guild_id in guild_to_start_msg and payload.message_id == guild_to_start_msg[payload.guild_id].id:
-        channel = client.get_channel(payload.channel_id)
-        start_msg = await channel.fetch_message(guild_to_start_msg[payload.guild_id].id)
-        players = set()
-        for reaction in start_msg.reactions:
-            users = await reaction.users().flatten()
-            players.update((user.id for user in users))
-        output_message = "React to this message if you're playing" + f' ({len(players)})' + ''.join([f'\t<@!{member}>' for member in players] )
-        await start_msg.edit(content=output_message)
+    lobby = guild_to_lobby.get(payload.guild_id)
+    if lobby is not None and payload.message_id == lobby.message_id:
+        if lobby.add(payload.user_id, payload.emoji):
+            start_msg_editor.schedule(lobby.message, lobby.roster_message())
+            # make sure the new player's rating is cached before matchmaking
+            try:
+                await executor.storage(payload.guild_id, get_skill, payload.user_id, payload.guild_id)
+            except MigrationError:
+                # commands report it, the prefetch is only an optimization
+                pass
 
 @client.event
 async def on_raw_reaction_remove(payload):
     # update start message with reactors
-    if payload.guild_id in guild_to_start_msg and payload.message_id == guild_to_start_msg[payload.guild_id].id:
-        channel = client.get_channel(payload.channel_id)
-        start_msg = await channel.fetch_message(guild_to_start_msg[payload.guild_id].id)
-        players = set()
-        for reaction in start_msg.reactions:
-            users = await reaction.users().flatten()
-            players.update((user.id for user in users))
-        output_message = "React to this message if you're playing" + f' ({len(players)})' + ''.join([f'\t<@!{member}>' for member in players])
-        await start_msg.edit(content=output_message)
+    lobby = guild_to_lobby.get(payload.guild_id)
+    if lobby is not None and payload.message_id == lobby.message_id:
+        if lobby.remove(payload.user_id, payload.emoji):
+            start_msg_editor.schedule(lobby.message, lobby.roster_message())
+        elif lobby.stale:
+            await sync_lobby(payload.guild_id, lobby)
+
+def add_to_leaderboard(guildid, userid):
+    # returning players keep their stored rating
+    stored = store.get(guildid, userid)
+    if guildid in leaderboards and stored is not None:
+        leaderboards[guildid].update(userid, *stored)
+
+def remove_from_leaderboard(guildid, userid):
+    if guildid in leaderboards:
+        leaderboards[guildid].remove(userid)
+
+@client.event
+async def on_member_join(member):
+    if member.guild.id in leaderboards:
+        await executor.storage(member.guild.id, add_to_leaderboard, member.guild.id, member.id)
+
+@client.event
+async def on_member_remove(member):
+    if member.guild.id in leaderboards:
+        await executor.storage(member.guild.id, remove_from_leaderboard, member.guild.id, member.id)
+
+async def register_channel(guildid, kind, channel_id):
+    '''
+    Records a created channel in memory right away and in the database on a storage thread.
+    '''
+    channel_registry.add(guildid, kind, channel_id)
+    await executor.storage(guildid, channel_registry.persist_add, guildid, kind, channel_id)
+
+async def forget_channel(channel_id):
+    guildid = channel_registry.discard(channel_id)
+    if guildid is not None:
+        await executor.storage(guildid, channel_registry.persist_discard, channel_id)
+
+async def get_match_channels(guild, create=False, match=1):
+    '''
+    Finds the VALORANT category and voice channels the bot created in a guild.
+    :param create: create (and register) any that are missing
+    :param match: 1-based match number, every match of $matches gets its own voice channels
+    :return: category, attacker voice channel, defender voice channel (None if missing)
+    '''
+    suffix = '' if match == 1 else f' {match}'
+    category = guild.get_channel(channel_registry.get(guild.id, CATEGORY))
+    attacker_channel = guild.get_channel(channel_registry.get(guild.id, match_kind(ATTACKERS, match)))
+    defender_channel = guild.get_channel(channel_registry.get(guild.id, match_kind(DEFENDERS, match)))
+    if create:
+        if category is None:
+            category = await guild.create_category_channel('VALORANT')
+            await register_channel(guild.id, CATEGORY, category.id)
+        if attacker_channel is None:
+            attacker_channel = await guild.create_voice_channel('Attackers' + suffix, category=category)
+            await register_channel(guild.id, match_kind(ATTACKERS, match), attacker_channel.id)
+        if defender_channel is None:
+            defender_channel = await guild.create_voice_channel('Defenders' + suffix, category=category)
+            await register_channel(guild.id, match_kind(DEFENDERS, match), defender_channel.id)
+    return category, attacker_channel, defender_channel
+
+def get_voice_channels(guild):
+    '''
+    :return: list of the voice channels (of every match) the bot created in a guild, None where missing
+    '''
+    return [guild.get_channel(id) for kind, id in channel_registry.channels(guild.id).items() if kind != CATEGORY]
+
+async def delete_match_channels(guild):
+    '''
+    Deletes the voice channels and category the bot created in a guild.
+    :return: list of deleted channels
+    '''
+    deleted = []
+    # voice channels first, the category can only go once it is empty
+    category = guild.get_channel(channel_registry.get(guild.id, CATEGORY))
+    for channel in get_voice_channels(guild) + [category]:
+        if channel is not None:
+            await channel.delete()
+            await forget_channel(channel.id)
+            deleted.append(channel)
+    return deleted
+
+@client.event
+async def on_guild_channel_delete(channel):
+    await forget_channel(channel.id)
 
 @client.event
 async def on_voice_state_update(member, before, after):
     '''
     Clean up created voice channels if they're empty.
-    (could be less janky if we kept track of the created voice channels explicitly)
     '''
-    if before.channel == None or before.channel.category == None or before.channel.category.name.lower() != 'valorant':
+    # only voice channels created by the bot are of interest
+    if before.channel is None or before.channel.id not in channel_registry:
         return
     guild = before.channel.guild
-    t_vc = ct_vc = None
-    # find channels
-    for vc in guild.voice_channels:
-        if vc.category == None or vc.category.name.lower() != 'valorant':
-            continue
-        if vc.name.lower() == 't':
-            t_vc = vc
-        elif vc.name.lower() == 'ct':
-            ct_vc = vc
-    # delete VALORANT channels if they're empty
-    if t_vc is not None and ct_vc is not None:
-        if len(t_vc.members) == len(ct_vc.members) == 0:
-            await t_vc.delete()
-            await ct_vc.delete()
-            for category in guild.categories:
-                if category.name.lower() == 'valorant':
-                    await category.delete()
+    voice_channels = get_voice_channels(guild)
+    # delete VALORANT channels once every match's channels are empty
+    if voice_channels and all(channel is not None and not channel.members for channel in voice_channels):
+        await delete_match_channels(guild)
 
 @client.event
 async def on_message(message):
-    
     # ignore your own messages
-    if message.author == client:
+    if message.author == client.user:
         return
-        
-    if message.content.startswith('$help'):
-        print(db_string(message.guild.id))
-        output_string = "**Available Commands:**\n"
-        output_string += "\t**$start** - start matchmaking process, bot sends message for players to react to\n"
-        output_string += "\t\t**$unrated** - create random teams from reactions to $start message\n"
-        output_string += "\t\t**$rated** - create teams based on MMR\n"
-        output_string += "\t\t\t**$attackers** - record a win for the Attackers\n"
-        output_string += "\t\t\t**$defenders** - record a win for the Defenders\n"
-        output_string += "\t\t**$move** - move players to generated teams' voice channels\n"
-        output_string += "\t\t**$back** - move all players into attacker voice channel\n"
-        output_string += "\t**$rating** - get your current rating\n"
-        output_string += "\t**$leaderboard** - get players sorted by rating\n"
-        output_string += "\t**$clean** - reset players and remove created voice channels\n"
-        output_string += "\t**$help** - list available commands"
-        await message.channel.send(output_string)
-
-    if message.content.startswith('$start'):
-        start_msg = await message.channel.send("React to this message if you're playing :)")
-        guild_to_start_msg[message.guild.id] = start_msg
-        # guild_to_teams[message.guild.id] = {'t':[], 'ct':[]}
-
-    if message.content.startswith('$unrated'):
-        # read reacts and make teams randomly without ranks
-        if message.guild.id not in guild_to_start_msg or guild_to_start_msg[message.guild.id] is None:
-            await message.channel.send('use $start before $unrated')
-        else:
-            start_time = time.time()
-            # read reacts
-            guild_to_teams[message.guild.id] = {'attackers':[], 'defenders':[]}
-            start_msg = await message.channel.fetch_message(guild_to_start_msg[message.guild.id].id)
-            players = set()
-            for reaction in start_msg.reactions:
-                users = await reaction.users().flatten()
-                players.update((user.id for user in users))
-            # create teams
-            players = list(players)
-            random.shuffle(players)
-            team_size = len(players) // 2
-            attackers = players[:team_size]
-            defenders = players[team_size:]
-            # create output
-            output_string += "\Attackers:\n"
-            for member in attackers:
-                output_string += f'\t<@!{member}>'
-            output_string += "\n\Defenders:\n"
-            for member in defenders:
-                output_string += f'\t<@!{member}>'
-            # store teams
-            guild_to_teams[message.guild.id]['attackers'] = attackers
-            guild_to_teams[message.guild.id]['defenders'] = defenders
-            # send output
-            print(f'[{message.guild.id}]: Unrated Game created in {round(time.time()-start_time, 4)}s')
-            await message.channel.send(output_string)
-    
-    if message.content.startswith('$rated'):
-        if message.guild.id not in guild_to_start_msg or guild_to_start_msg[message.guild.id] is None:
-            await message.channel.send('use *$start* before *$rated*')
-        else:
-            start_time = time.time()
-            # read reacts
-            guild_to_teams[message.guild.id] = {'attackers':[], 'defenders':[]}
-            start_msg = await message.channel.fetch_message(guild_to_start_msg[message.guild.id].id)
-            players = set()
-            for reaction in start_msg.reactions:
-                users = await reaction.users().flatten()
-                players.update((user.id for user in users))
-            # must have at least one member on each team
-            if len(players) < 2:
-                await message.channel.send('must have **at least 2 players** for rated game')
-                return
-            # create teams
-            attackers, defenders, quality = make_teams(list(players), message.guild.id)
-            # create output
-            output_string = f'Predicted Quality: {round(quality*200, 2)}\n'
-            output_string += "\nAttackers:\n"
-            for member in attackers:
-                output_string += f'\t<@!{member}>({round(get_skill(member, message.guild.id).mu, 2)}) '
-            output_string += "\n\nDefenders:\n"
-            for member in defenders:
-                output_string += f'\t<@!{member}>({round(get_skill(member, message.guild.id).mu, 2)}) '
-            # store teams
-            guild_to_teams[message.guild.id]['attackers'] = attackers
-            guild_to_teams[message.guild.id]['defenders'] = defenders
-            # send output
-            print(f'[{message.guild.id}]: Rated Game created in {round(time.time()-start_time, 4)}s')
-            await message.channel.send(output_string)
-    
-    if message.content.startswith('$attackers'):
-        if message.author.id not in ADMINS:
-            await message.channel.send('Permission Denied ❌. Blame Djaenk')
-            return
-        if not guild_to_teams[message.guild.id]['t']:
-            await message.channel.send('use *$make* or *$rated* before recording a result')
+    await router.dispatch(message)
+
+@router.command('help', cooldown=5)
+async def help_command(message, args):
+    output_string = "**Available Commands:**\n"
+    output_string += "\t**$start** - start matchmaking process, bot sends message for players to react to\n"
+    output_string += "\t\t**$unrated** - create random teams from reactions to $start message\n"
+    output_string += "\t\t**$rated** - create teams based on MMR\n"
+    output_string += f"\t\t**$matches** *[team size]* - split players into several balanced matches ({MATCH_TEAM_SIZE}v{MATCH_TEAM_SIZE} by default)\n"
+    output_string += "\t\t\t**$attackers** *[match]* - record a win for the Attackers\n"
+    output_string += "\t\t\t**$defenders** *[match]* - record a win for the Defenders\n"
+    output_string += "\t\t\t**$undo** *[n]* - undo the last n recorded results\n"
+    output_string += "\t\t**$move** *[match]* - move players to generated teams' voice channels\n"
+    output_string += "\t\t**$back** *[match]* - move all players into attacker voice channel\n"
+    output_string += "\t**$rating** - get your current rating\n"
+    output_string += "\t**$leaderboard** *[page | me]* - get players sorted by rating\n"
+    output_string += "\t**$clean** - reset players and remove created voice channels\n"
+    output_string += "\t**$help** - list available commands"
+    await message.channel.send(output_string)
+
+@router.command('start', cooldown=2)
+async def start_command(message, args):
+    start_msg = await message.channel.send("React to this message if you're playing :)")
+    if message.guild.id in guild_to_lobby:
+        start_msg_editor.discard(guild_to_lobby[message.guild.id].message)
+    guild_to_lobby[message.guild.id] = Lobby(start_msg)
+    # keep this guild's ratings in memory while the lobby is active
+    ratings_cache.pin(message.guild.id)
+    await executor.storage(message.guild.id, warm_cache, message.guild.id)
+
+@router.command('unrated', cooldown=2)
+async def unrated_command(message, args):
+    # read reacts and make teams randomly without ranks
+    if message.guild.id not in guild_to_lobby:
+        await message.channel.send('use $start before $unrated')
+        return
+    start_time = time.time()
+    # read reacts
+    guild_to_teams[message.guild.id] = []
+    players = guild_to_lobby[message.guild.id].players
+    # create teams
+    random.shuffle(players)
+    team_size = len(players) // 2
+    attackers = players[:team_size]
+    defenders = players[team_size:]
+    # create output
+    output_string = "Attackers:\n"
+    for member in attackers:
+        output_string += f'\t<@!{member}>'
+    output_string += "\n\nDefenders:\n"
+    for member in defenders:
+        output_string += f'\t<@!{member}>'
+    # store teams
+    guild_to_teams[message.guild.id] = [{'attackers': attackers, 'defenders': defenders, 'recorded': False}]
+    # keep the players' ratings in memory until the result is recorded
+    ratings_cache.pin(message.guild.id)
+    # send output
+    log.info('Unrated game created', extra={'guild': message.guild.id, 'command': 'unrated', 'duration': time.time()-start_time})
+    await message.channel.send(output_string)
+
+@router.command('rated', cooldown=2)
+async def rated_command(message, args):
+    if message.guild.id not in guild_to_lobby:
+        await message.channel.send('use *$start* before *$rated*')
+        return
+    start_time = time.time()
+    # read reacts
+    guild_to_teams[message.guild.id] = []
+    players = guild_to_lobby[message.guild.id].players
+    # must have at least one member on each team
+    if len(players) < 2:
+        await message.channel.send('must have **at least 2 players** for rated game')
+        return
+    # create teams
+    attackers, defenders, quality, ratings = await make_teams(players, message.guild.id)
+    # create output
+    output_string = f'Predicted Quality: {round(quality*200, 2)}\n'
+    output_string += "\nAttackers:\n"
+    for member in attackers:
+        output_string += f'\t<@!{member}>({round(ratings[member].mu, 2)}) '
+    output_string += "\n\nDefenders:\n"
+    for member in defenders:
+        output_string += f'\t<@!{member}>({round(ratings[member].mu, 2)}) '
+    # store teams
+    guild_to_teams[message.guild.id] = [{'attackers': attackers, 'defenders': defenders, 'recorded': False}]
+    # keep the players' ratings in memory until the result is recorded
+    ratings_cache.pin(message.guild.id)
+    # send output
+    log.info('Rated game created', extra={'guild': message.guild.id, 'command': 'rated', 'duration': time.time()-start_time})
+    await message.channel.send(output_string)
+
+@router.command('matches', cooldown=2)
+async def matches_command(message, args):
+    if message.guild.id not in guild_to_lobby:
+        await message.channel.send('use *$start* before *$matches*')
+        return
+    start_time = time.time()
+    team_size = int(args[0]) if args and args[0].isdigit() and int(args[0]) > 0 else MATCH_TEAM_SIZE
+    players = guild_to_lobby[message.guild.id].players
+    count = len(players) // (2 * team_size)
+    if not count:
+        await message.channel.send(f'must have **at least {2 * team_size} players** for {team_size}v{team_size} matches')
+        return
+    # first come, first served: the latest reactors sit out if the lobby doesn't split evenly
+    playing, waiting = players[:2 * team_size * count], players[2 * team_size * count:]
+    guild_to_teams[message.guild.id] = []
+    ratings = await executor.storage(message.guild.id, get_skills, playing, message.guild.id)
+    matches = await executor.cpu(balance_matches, ratings, team_size)
+    # store teams before anything is sent, so a failed send never loses them
+    guild_to_teams[message.guild.id] = [{'attackers': attackers, 'defenders': defenders, 'recorded': False} for attackers, defenders, _ in matches]
+    ratings_cache.pin(message.guild.id)
+    log.info(f'{len(matches)} matches created', extra={'guild': message.guild.id, 'command': 'matches', 'duration': time.time()-start_time})
+    # one message per match keeps large lobbies under Discord's message limit
+    for number, (attackers, defenders, quality) in enumerate(matches, 1):
+        output_string = f'**Match {number}** - Predicted Quality: {round(quality*200, 2)}\n'
+        output_string += "Attackers:\n"
+        for member in attackers:
+            output_string += f'\t<@!{member}>({round(ratings[member].mu, 2)}) '
+        output_string += "\nDefenders:\n"
+        for member in defenders:
+            output_string += f'\t<@!{member}>({round(ratings[member].mu, 2)}) '
+        await send_long(message.channel, output_string)
+    if waiting:
+        output_string = "Sitting out:\n"
+        for member in waiting:
+            output_string += f'\t<@!{member}>'
+        await send_long(message.channel, output_string)
+
+async def send_long(channel, text, limit=MESSAGE_LIMIT):
+    '''
+    Sends text as several messages if it is longer than Discord allows, splitting between players.
+    '''
+    while len(text) > limit:
+        cut = max(text.rfind('\n', 0, limit), text.rfind('\t', 0, limit))
+        if cut <= 0:
+            cut = limit
+        await channel.send(text[:cut])
+        text = text[cut:]
+    if text:
+        await channel.send(text)
+
+def get_match(message, args):
+    '''
+    Picks the match a command refers to from its optional 1-based match number argument.
+    :return: match number, dict of team name -> userids, or None if there is no such match
+    '''
+    matches = guild_to_teams.get(message.guild.id) or []
+    number = int(args[0]) if args and args[0].isdigit() else 1
+    if not 1 <= number <= len(matches):
+        return number, None
+    return number, matches[number - 1]
+
+async def record_win(message, winner, args):
+    '''
+    Records a win for one side of one of the guild's current matches and reports the rating changes.
+    :param winner: 'attackers' or 'defenders'
+    :param args: optional match number, defaults to the first match
+    '''
+    matches = guild_to_teams.get(message.guild.id)
+    number, teams = get_match(message, args)
+    if number > 1 and teams is None:
+        await message.channel.send(f'there is no match {number}')
+        return
+    if not teams or not teams['attackers'] or not teams['defenders']:
+        await message.channel.send('use *$unrated*, *$rated* or *$matches* before recording a result')
+        return
+    if teams['recorded']:
+        await message.channel.send(f'match {number} already has a result, use *$undo* to take it back')
+        return
+    # claim the match before awaiting so a repeated command can't rate it twice
+    teams['recorded'] = True
+    try:
+        if winner == 'attackers':
+            attackers, defenders, attackers_new, defenders_new = await executor.storage(message.guild.id, record_match, teams['attackers'], teams['defenders'], ATTACKERS_WON, message.guild.id)
         else:
-            attackers, defenders, attackers_new, defenders_new = record_result(guild_to_teams[message.guild.id]['attackers'], guild_to_teams[message.guild.id]['defenders'], message.guild.id)
-            output_string = '**Win for** ***Attackers*** **recorded.**\n'
-            output_string += "\n**Attackers:**\n"
-            for member in attackers:
-                output_string += f'\t<@!{member}> ({round(attackers[member].mu, 2)} -> {round(attackers_new[member].mu, 2)})\n'
-            output_string += "\n\n**Defenders:**\n"
-            for member in defenders:
-                output_string += f'\t<@!{member}> ({round(defenders[member].mu, 2)} -> {round(defenders_new[member].mu, 2)})\n'
-            # send output
-            await message.channel.send(output_string)
-    
-    if message.content.startswith('$defenders'):
-        if message.author.id not in ADMINS:
-            await message.channel.send('Permission Denied ❌. Blame Djaenk')
-            return
-        if not guild_to_teams[message.guild.id]['defenders']:
-            await message.channel.send('use *$make* or *$rated* before recording a result')
+            defenders, attackers, defenders_new, attackers_new = await executor.storage(message.guild.id, record_match, teams['attackers'], teams['defenders'], DEFENDERS_WON, message.guild.id)
+    except BaseException:
+        teams['recorded'] = False
+        raise
+    # once every match has a result the teams are done, the $start lobby stays for the next round
+    if all(match['recorded'] for match in matches):
+        ratings_cache.unpin(message.guild.id)
+        if guild_to_teams.get(message.guild.id) is matches:
+            guild_to_teams[message.guild.id] = []
+    output_string = f'**Win for** ***{winner.capitalize()}*** **recorded.**\n'
+    if len(matches) > 1:
+        output_string = f'**Match {number}:** ' + output_string
+    output_string += "\n**Attackers:**\n"
+    for member in attackers:
+        output_string += f'\t<@!{member}> ({round(attackers[member].mu, 2)} -> {round(attackers_new[member].mu, 2)})\n'
+    output_string += "\n\n**Defenders:**\n"
+    for member in defenders:
+        output_string += f'\t<@!{member}> ({round(defenders[member].mu, 2)} -> {round(defenders_new[member].mu, 2)})\n'
+    # send output
+    await message.channel.send(output_string)
+
+@router.command('attackers', admin=True, denied='Permission Denied ❌. Blame Djaenk')
+async def attackers_command(message, args):
+    await record_win(message, 'attackers', args)
+
+@router.command('defenders', admin=True, denied='Permission Denied ❌. Blame Djaenk')
+async def defenders_command(message, args):
+    await record_win(message, 'defenders', args)
+
+@router.command('undo', admin=True, cooldown=2, denied='Permission Denied ❌. Blame Djaenk')
+async def undo_command(message, args):
+    count = int(args[0]) if args and args[0].isdigit() else 1
+    undone, remaining = await rerate(message.guild.id, undo=count)
+    if not undone:
+        await message.channel.send('No recorded matches to undo.')
+        return
+    await message.channel.send(f"Undid {undone} match{'es' if undone != 1 else ''}, ratings recomputed from {remaining} remaining.")
+
+@router.command('rerate', admin=True, cooldown=10, denied='Permission Denied ❌. Blame Djaenk')
+async def rerate_command(message, args):
+    start_time = time.time()
+    _, replayed = await rerate(message.guild.id)
+    log.info(f'Replayed {replayed} matches', extra={'guild': message.guild.id, 'command': 'rerate', 'duration': time.time()-start_time})
+    await message.channel.send(f"Ratings recomputed from {replayed} recorded match{'es' if replayed != 1 else ''}.")
+
+@router.command('leaderboard', cooldown=3)
+async def leaderboard_command(message, args):
+    start_time = time.time()
+    # $leaderboard [page] or $leaderboard me
+    if args and args[0].lower() == 'me':
+        count, entries = await executor.storage(message.guild.id, read_leaderboard, message.guild, userid=message.author.id)
+    else:
+        page = int(args[0]) if args and args[0].isdigit() else 1
+        count, entries = await executor.storage(message.guild.id, read_leaderboard, message.guild, page=page)
+    if not count:
+        await message.channel.send('No Ranked Players.')
+        return
+    if not entries:
+        if args and args[0].lower() == 'me':
+            await message.channel.send('You are not ranked yet.')
         else:
-            defenders, attackers, defenders_new, attackers_new = record_result(guild_to_teams[message.guild.id]['defenders'], guild_to_teams[message.guild.id]['attackers'], message.guild.id)
-            output_string = '**Win for** ***Defenders*** **recorded.**\n'
-            output_string += "\n**Attackers:**\n"
-            for member in attackers:
-                output_string += f'\t<@!{member}> ({round(attackers[member].mu, 2)} -> {round(attackers_new[member].mu, 2)})\n'
-            output_string += "\n\n**Defenders:**\n"
-            for member in defenders:
-                output_string += f'\t<@!{member}> ({round(defenders[member].mu, 2)} -> {round(defenders_new[member].mu, 2)})\n'
-            # send output
-            await message.channel.send(output_string)
-
-    if message.content.startswith('$leaderboard'):
-        start_time = time.time()
-        leaderboard = get_leaderboard(message.guild.id)
-        if not leaderboard:
-            await message.channel.send('No Ranked Players.')
-            return
-        output_string = ''
-        rank = 0
-        last = 0, 0, 0    # mu, sigma, rank
-        for item in leaderboard:
-            member = message.guild.get_member(int(item[0]))
-            if member:
-                rank += 1
-                if (item[1].mu, item[1].sigma) == last[:2]:
-                    output_string += f'**{last[2]}**. ***{member.name}*** - {round(item[1].mu, 4)} ± {round(item[1].sigma, 2)}\n'
-                else:
-                    output_string += f'**{rank}**. ***{member.name}*** - {round(item[1].mu, 4)} ± {round(item[1].sigma, 2)}\n'
-                last = item[1].mu, item[1].sigma, rank
-        print(f'[{message.guild.id}]: Leaderboard fetched in {round(time.time()-start_time, 4)}s')
-        await message.channel.send(output_string)
-    
-    if message.content.startswith('$move'):
-        if message.guild.id not in guild_to_teams:
-            await message.channel.send("Use $start to begin matchmaking.")
+            await message.channel.send(f'Leaderboard only has {(count - 1) // PAGE_SIZE + 1} page(s).')
+        return
+    output_string = ''
+    for rank, id, mu, sigma in entries:
+        member = message.guild.get_member(id)
+        name = member.name if member else id
+        output_string += f'**{rank}**. ***{name}*** - {round(mu, 4)} ± {round(sigma, 2)}\n'
+    log.info('Leaderboard fetched', extra={'guild': message.guild.id, 'command': 'leaderboard', 'duration': time.time()-start_time})
+    await message.channel.send(output_string)
+
+@router.command('move', cooldown=3)
+async def move_command(message, args):
+    if not guild_to_teams.get(message.guild.id):
+        await message.channel.send("Use $start to begin matchmaking.")
+        return
+    guild = message.guild
+    matches = guild_to_teams[guild.id]
+    # $move n moves a single match, plain $move moves every match
+    numbers = [int(args[0])] if args and args[0].isdigit() else range(1, len(matches) + 1)
+    moves = []
+    for number in numbers:
+        if not 1 <= number <= len(matches):
+            await message.channel.send(f'there is no match {number}')
             return
-        guild = message.guild
-        # find attacker and defender voice channels
-        attacker_channel, defender_channel = None, None
-        # check if Valorant channel category exists
-        valorant_category = None
-        for category in guild.categories:
-            if category.name.lower() == 'valorant':
-                valorant_category = category
-        if valorant_category is None:
-            # make it
-            valorant_category = await guild.create_category_channel('VALORANT')
-            # await message.channel.send("VALORANT category created.")
-        for vc in guild.voice_channels:
-            # ignore voice channels outside of VALORANT
-            if vc.category != valorant_category:
-                continue
-            if vc.name.lower() == 't':
-                attacker_channel = vc
-            elif vc.name.lower() == 'ct':
-                defender_channel = vc
-        # create vc if necessary
-        if attacker_channel is None:
-            attacker_channel = await guild.create_voice_channel('Attackers', category=valorant_category)
-        if defender_channel is None:
-            defender_channel = await guild.create_voice_channel('Defenders', category=valorant_category)
+        # find attacker and defender voice channels, creating them if necessary
+        _, attacker_channel, defender_channel = await get_match_channels(guild, create=True, match=number)
         # move members to right channel
-        attackers = guild_to_teams[guild.id]['attackers']
-        defenders = guild_to_teams[guild.id]['defenders']
-        count = 0
-        for attacker in attackers:
-            member = guild.get_member(attacker)
-            if member.voice is not None:
-                count += 1
-                await member.move_to(attacker_channel)
-        for defender in defenders:
-            member = guild.get_member(defender)
-            if member.voice is not None:
-                count += 1
-                await member.move_to(defender_channel)
-        await message.channel.send(f"{count} player{'s' if count > 1 else ''} moved.")
-    
-    if message.content.startswith('$back'):
-        # find VALORANT voice channels
-        guild = message.guild
-        for vc in guild.voice_channels:
-            # ignore voice channels outside of VALORANT
-            if vc.category is not None and vc.category.name.lower() != 'valorant':
-                continue
-            elif vc.name.lower() == 'attackers':
-                for vc2 in guild.voice_channels:
-                    if vc2.name.lower() == 'defenders':
-                        for defender in vc.members:
-                            await defender.move_to(vc2)
-                        await message.channel.send('✅')
-
-    if message.content.startswith('$rating'):
-        if message.raw_mentions:
-            for id in message.raw_mentions:
-                skill = get_skill(id, message.guild.id)
-                await message.channel.send(f'\t<@!{id}> - {round(skill.mu, 4)} ± {round(skill.sigma, 2)}\n')
-        else:
-            authorid = message.author.id
-            skill = get_skill(authorid, message.guild.id)
-            await message.channel.send(f'\t<@!{authorid}> - {round(skill.mu, 4)} ± {round(skill.sigma, 2)}')
-
-    # remove valorant category and voice channels
-    if message.content.startswith('$clean'):
-        # find VALORANT voice channels
-        guild = message.guild
-        for vc in guild.voice_channels:
-            # ignore voice channels outside of VALORANT
-            if vc.category is not None and vc.category.name.lower() != 'valorant':
-                continue
-            if vc.name.lower() == 'attackers':
-                await vc.delete()
-                await message.channel.send('Attacker voice channel deleted.')
-            elif vc.name.lower() == 'defenders':
-                await vc.delete()
-                await message.channel.send('Defender voice channel deleted.')
-        # delete VALORANT category
-        for category in guild.categories:
-            if category.name.lower() == 'valorant':
-                await category.delete()
-                await message.channel.send('VALORANT category deleted.')
-        guild_to_teams[message.guild.id] = {'attackers':[], 'defenders':[]}
-        await message.channel.send('Players emptied.')
-    
-    # admin-only clearing of repl db
-    if message.content.startswith('$cleardb'):
-        if message.author.id in ADMINS:
-            clear_db(message.guild.id)
-            await message.channel.send('Database cleared.')
-        else:
-            await message.channel.send('Permission denied.')
+        moves += [(guild.get_member(attacker), attacker_channel) for attacker in matches[number - 1]['attackers']]
+        moves += [(guild.get_member(defender), defender_channel) for defender in matches[number - 1]['defenders']]
+    summary = await move_members(moves)
+    await message.channel.send(str(summary))
+
+@router.command('back', cooldown=3)
+async def back_command(message, args):
+    # find VALORANT voice channels
+    number = int(args[0]) if args and args[0].isdigit() else 1
+    _, attacker_channel, defender_channel = await get_match_channels(message.guild, match=number)
+    if attacker_channel is not None and defender_channel is not None:
+        summary = await move_members((member, defender_channel) for member in attacker_channel.members)
+        await message.channel.send('✅' if not summary.failed else str(summary))
+
+@router.command('rating')
+async def rating_command(message, args):
+    if message.raw_mentions:
+        for id in message.raw_mentions:
+            skill = await executor.storage(message.guild.id, get_skill, id, message.guild.id)
+            await message.channel.send(f'\t<@!{id}> - {round(skill.mu, 4)} ± {round(skill.sigma, 2)}\n')
+    else:
+        authorid = message.author.id
+        skill = await executor.storage(message.guild.id, get_skill, authorid, message.guild.id)
+        await message.channel.send(f'\t<@!{authorid}> - {round(skill.mu, 4)} ± {round(skill.sigma, 2)}')
+
+# remove valorant category and voice channels
+@router.command('clean', cooldown=3)
+async def clean_command(message, args):
+    # delete VALORANT voice channels and category
+    for channel in await delete_match_channels(message.guild):
+        await message.channel.send(f'{channel.name} channel deleted.')
+    guild_to_teams[message.guild.id] = []
+    close_lobby(message.guild.id)
+    await message.channel.send('Players emptied.')
+
+# admin-only clearing of repl db
+@router.command('cleardb', admin=True)
+async def cleardb_command(message, args):
+    await executor.storage(message.guild.id, clear_db, message.guild.id)
+    await message.channel.send('Database cleared.')
 
-client.run(os.getenv('TOKEN'))
\ No newline at end of file
+if __name__ == '__main__':
+    keep_alive()
+    client.run(os.getenv('TOKEN'))
\ No newline at end of file
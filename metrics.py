@@ -0,0 +1,192 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+# default histogram buckets (seconds)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# longest sampling profile that can be requested (seconds)
+MAX_PROFILE_SECONDS = 60
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def time(self, *labels):
+        '''
+        Context manager observing the duration of its block.
+        '''
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, values in sorted(self._values.items()):
+                names = self.labels + ('le',)
+                for bound, count in zip(self.buckets, values):
+                    lines.append(f'{self.name}_bucket{_format_labels(names, labels + (bound,))} {count}')
+                lines.append(f'{self.name}_bucket{_format_labels(names, labels + ("+Inf",))} {values[-1]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labels, labels)} {values[-2]}')
+                lines.append(f'{self.name}_count{_format_labels(self.labels, labels)} {values[-1]}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Gauge:
+    '''
+    Value read from a callback when metrics are rendered.
+    :param kind: 'gauge', or 'counter' for callbacks returning a running total
+    '''
+
+    def __init__(self, name, documentation, callback, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.kind = kind
+
+    def render(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}',
+                f'{self.name} {float(self.callback())}']
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name, documentation, callback, kind='gauge'):
+        return self.register(Gauge(name, documentation, callback, kind))
+
+    def render(self):
+        '''
+        :return: all metrics in the Prometheus text exposition format
+        '''
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f'# {metric.name} unavailable: {e}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+COMMAND_LATENCY = registry.register(Histogram('bot_command_seconds', 'Time spent handling a $command.', ['command']))
+STORAGE_LATENCY = registry.register(Histogram('bot_storage_seconds', 'Time spent in storage work on the storage threads.', ['operation']))
+API_REQUESTS = registry.register(Counter('bot_discord_requests_total', 'Discord HTTP API requests.', ['method', 'route']))
+API_RATE_LIMITS = registry.register(Counter('bot_discord_rate_limited_total', 'Discord HTTP API 429 responses.'))
+
+
+class RateLimitCounter(logging.Handler):
+    '''
+    Counts 429s by watching discord.http's log: discord.py retries them internally,
+    so they never surface to the caller.
+    '''
+
+    def emit(self, record):
+        if record.getMessage().startswith('We are being rate limited'):
+            API_RATE_LIMITS.inc()
+
+
+def instrument_http(http):
+    '''
+    Counts the requests made through a discord.py HTTPClient, and its 429s.
+    '''
+    request = http.request
+
+    async def counted_request(route, **kwargs):
+        API_REQUESTS.inc(route.method, route.path)
+        return await request(route, **kwargs)
+
+    http.request = counted_request
+    logger = logging.getLogger('discord.http')
+    # the rate-limit warnings must get through even if discord's logs are quieter
+    if logger.getEffectiveLevel() > logging.WARNING:
+        logger.setLevel(logging.WARNING)
+    if not any(isinstance(handler, RateLimitCounter) for handler in logger.handlers):
+        logger.addHandler(RateLimitCounter(level=logging.WARNING))
+
+
+def sample_profile(seconds, interval=0.005):
+    '''
+    Samples the stacks of every other thread for a while.
+    :return: collapsed stacks ("outer;inner count" lines), the format flame graph tools read
+    '''
+    seconds = min(float(seconds), MAX_PROFILE_SECONDS)
+    me = threading.get_ident()
+    stacks = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+                frame = frame.f_back
+            stacks[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return '\n'.join(f'{stack} {count}' for stack, count in stacks.most_common()) + '\n'
@@ -0,0 +1,83 @@
+import os
+
+
+def shard_for(guildid, shard_count):
+    '''
+    :return: id of the gateway shard that receives guildid's events (Discord's own formula)
+    '''
+    return (int(guildid) >> 22) % max(1, shard_count)
+
+
+def shard_config():
+    '''
+    Reads SHARD_COUNT and SHARD_IDS (comma separated) from the environment.
+    Unset values are left to discord.py, which then asks Discord for the recommended count.
+    :return: (shard_count or None, list of shard ids or None)
+    '''
+    shard_count = os.getenv('SHARD_COUNT')
+    shard_ids = os.getenv('SHARD_IDS')
+    shard_count = int(shard_count) if shard_count else None
+    shard_ids = [int(id) for id in shard_ids.split(',') if id.strip()] if shard_ids else None
+    if shard_ids is not None:
+        if shard_count is None:
+            raise ValueError('SHARD_IDS requires SHARD_COUNT')
+        if any(not 0 <= id < shard_count for id in shard_ids):
+            raise ValueError(f'SHARD_IDS must be in [0, {shard_count})')
+    return shard_count, shard_ids
+
+
+class GuildMap:
+    '''
+    Dict of guild id -> guild-local state, partitioned by gateway shard.
+    Behaves like a plain dict keyed by guild id, and shard(id) gives the guilds of one
+    shard so a shard that reconnects or goes away only touches its own guilds.
+    :param shard_count: callable returning the current shard count
+    '''
+
+    def __init__(self, shard_count):
+        self._shard_count = shard_count
+        # shard id -> {guild id -> value}
+        self._shards = {}
+
+    def _partition(self, guildid, create=False):
+        shard_id = shard_for(guildid, self._shard_count() or 1)
+        if create:
+            return self._shards.setdefault(shard_id, {})
+        return self._shards.get(shard_id, {})
+
+    def shard(self, shard_id):
+        '''
+        :return: dict of guild id -> value for the guilds of shard_id
+        '''
+        return self._shards.get(shard_id, {})
+
+    def get(self, guildid, default=None):
+        if guildid is None:
+            return default
+        return self._partition(guildid).get(int(guildid), default)
+
+    def pop(self, guildid, default=None):
+        return self._partition(guildid).pop(int(guildid), default)
+
+    def __getitem__(self, guildid):
+        return self._partition(guildid)[int(guildid)]
+
+    def __setitem__(self, guildid, value):
+        self._partition(guildid, create=True)[int(guildid)] = value
+
+    def __delitem__(self, guildid):
+        del self._partition(guildid)[int(guildid)]
+
+    def __contains__(self, guildid):
+        if guildid is None:
+            return False
+        return int(guildid) in self._partition(guildid)
+
+    def __len__(self):
+        return sum(len(guilds) for guilds in self._shards.values())
+
+    def values(self):
+        return [value for guilds in self._shards.values() for value in guilds.values()]
+
+    def items(self):
+        return [item for guilds in self._shards.values() for item in guilds.items()]
@@ -0,0 +1,122 @@
+import mmap
+import os
+import struct
+import threading
+
+import numpy as np
+
+# file layout: header, then count sorted int64 user ids, count float64 mus, count float64 sigmas
+MAGIC = b'RATSNAP1'
+HEADER = struct.Struct('<8sq')
+
+
+def snapshot_path(directory, guildid):
+    return os.path.join(directory, f'{int(guildid)}.ratings')
+
+
+def write_snapshot(path, ratings):
+    '''
+    Writes a guild's ratings as a columnar snapshot, replacing any earlier snapshot atomically.
+    :param ratings: dict of userid -> (mu, sigma)
+    '''
+    commit_snapshot(prepare_snapshot(path, ratings), path)
+
+
+def prepare_snapshot(path, ratings):
+    '''
+    Writes and fsyncs a snapshot to a temporary file next to path.
+    :param ratings: dict of userid -> (mu, sigma)
+    :return: path of the temporary file, to pass to commit_snapshot (or delete)
+    '''
+    userids = np.fromiter(ratings, dtype=np.int64, count=len(ratings))
+    order = np.argsort(userids)
+    values = np.array(list(ratings.values()), dtype=np.float64).reshape(-1, 2)[order]
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(userids)))
+            f.write(userids[order].astype('<i8').tobytes())
+            f.write(np.ascontiguousarray(values[:, 0], dtype='<f8').tobytes())
+            f.write(np.ascontiguousarray(values[:, 1], dtype='<f8').tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return tmp
+
+
+def commit_snapshot(tmp, path):
+    '''
+    Renames a prepared snapshot over path, so a crash leaves either the old or the
+    new snapshot, never a partial one.
+    '''
+    os.replace(tmp, path)
+    # make the rename itself durable
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class Snapshot:
+    '''
+    Read-only view of a rating snapshot file.
+    The file is memory-mapped and its columns are used as NumPy arrays in place, so
+    opening a snapshot costs the same for ten players or a million.
+    :raises ValueError: if the file is not a complete snapshot
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._mmap) if len(self._mmap) >= HEADER.size else (None, 0)
+        if magic != MAGIC or len(self._mmap) != HEADER.size + 24 * count:
+            self._mmap.close()
+            raise ValueError(f'{path} is not a rating snapshot')
+        self.userids = np.frombuffer(self._mmap, dtype='<i8', count=count, offset=HEADER.size)
+        self.mus = np.frombuffer(self._mmap, dtype='<f8', count=count, offset=HEADER.size + 8 * count)
+        self.sigmas = np.frombuffer(self._mmap, dtype='<f8', count=count, offset=HEADER.size + 16 * count)
+
+    def __len__(self):
+        return len(self.userids)
+
+    def lookup(self, userids):
+        '''
+        Vectorized lookup of many players with one binary search each.
+        :param userids: sequence of user ids
+        :return: (found, mus, sigmas) arrays aligned with userids; mus and sigmas are meaningless where found is False
+        '''
+        userids = np.asarray(userids, dtype=np.int64)
+        if not len(self.userids):
+            missing = np.zeros(len(userids))
+            return missing.astype(bool), missing, missing
+        positions = np.minimum(np.searchsorted(self.userids, userids), len(self.userids) - 1)
+        return self.userids[positions] == userids, self.mus[positions], self.sigmas[positions]
+
+    def get_many(self, userids):
+        '''
+        :return: dict of userid -> (mu, sigma) for every userid in the snapshot
+        '''
+        userids = [int(userid) for userid in userids]
+        found, mus, sigmas = self.lookup(userids)
+        return {userid: (mu, sigma) for userid, hit, mu, sigma in zip(userids, found.tolist(), mus.tolist(), sigmas.tolist()) if hit}
+
+    def as_dict(self):
+        '''
+        :return: dict of userid -> (mu, sigma) for every player in the snapshot
+        '''
+        return dict(zip(self.userids.tolist(), zip(self.mus.tolist(), self.sigmas.tolist())))
+
+    def close(self):
+        # the arrays borrow the mapping, drop them before unmapping
+        self.userids = self.mus = self.sigmas = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # a caller still holds a view; the mapping goes away with it
+            pass
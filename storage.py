@@ -0,0 +1,386 @@
+import atexit
+import dbm
+import logging
+import os
+import shelve
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from snapshot import Snapshot, commit_snapshot, prepare_snapshot, snapshot_path
+
+# default location of the ratings database
+DB_PATH = os.getenv('RATINGS_DB', 'ratings.sqlite3')
+
+# directory holding the legacy <guildid>.db shelve files, next to the bot by default
+SHELVE_DIR = os.getenv('SHELVE_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# file names a shelve can be stored under, depending on the dbm backend that wrote it
+SHELVE_SUFFIXES = ('', '.db', '.dat', '.dir', '.pag')
+
+# seconds between snapshots of the guilds whose ratings changed
+SNAPSHOT_INTERVAL = 300.0
+
+# most snapshots kept memory-mapped at once (each holds a file descriptor)
+MAX_OPEN_SNAPSHOTS = 256
+
+# seconds a connection waits for another process's write lock before giving up
+BUSY_TIMEOUT = 30.0
+
+log = logging.getLogger('bot.storage')
+
+
+class MigrationError(Exception):
+    '''
+    A guild's legacy shelve exists but could not be read, so its ratings were not migrated.
+    '''
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ratings (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    mu REAL NOT NULL,
+    sigma REAL NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS migrated_guilds (
+    guild_id INTEGER PRIMARY KEY
+);
+'''
+
+
+def connect(path):
+    '''
+    Opens a connection that can be shared by threads and by several bot processes:
+    WAL mode lets readers run alongside the single writer, and writers wait up to
+    BUSY_TIMEOUT for each other. Write transactions should use BEGIN IMMEDIATE so
+    they take the write lock up front instead of failing on upgrade.
+    '''
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}')
+    return conn
+
+
+class RatingStore:
+    '''
+    Persistent TrueSkill rating storage.
+    Keeps a single SQLite connection (see connect) open for the lifetime of the bot
+    and stores one row per (guild_id, user_id). Writes are buffered and flushed
+    in batches, either when enough are pending or every flush_interval seconds.
+    Guilds whose ratings have not changed since their last snapshot are read from
+    a memory-mapped columnar snapshot (see snapshot.py) instead of SQLite. A guild's
+    snapshot is deleted on its first write, and rewritten every snapshot_interval
+    seconds and on close, so a snapshot on disk always matches the database.
+    '''
+
+    def __init__(self, path=DB_PATH, flush_interval=2.0, batch_size=64, snapshot_dir=None, snapshot_interval=SNAPSHOT_INTERVAL,
+                 shelve_dir=SHELVE_DIR):
+        self.path = path
+        self.shelve_dir = shelve_dir
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.snapshot_dir = snapshot_dir or f'{path}-snapshots'
+        self.snapshot_interval = snapshot_interval
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = connect(path)
+        self._conn.executescript(SCHEMA)
+        # (guild_id, user_id) -> (mu, sigma) waiting to be written
+        self._pending = {}
+        self._migrated = set()
+        # guild id -> MigrationError of a shelve that could not be read, so it is read and logged once per process
+        self._migration_errors = {}
+        # guild id -> open Snapshot, or None if the guild has no usable snapshot; least recent first
+        self._snapshots = OrderedDict()
+        # guild id -> number of writes, so a snapshot can tell the guild changed while it was taken
+        self._generations = {}
+        # guilds written since their last snapshot
+        self._dirty = set()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # migration from the old per-guild shelve files
+    def _ensure_migrated(self, guildid):
+        '''
+        Imports the ratings of a guild from its <guildid>.db shelve file the first
+        time the guild is touched. Guilds are only ever migrated once, and only
+        marked migrated if they have no shelve or it was read successfully.
+        A shelve that cannot be read is only tried once per process; later calls
+        raise the same error again.
+        :raises MigrationError: if the guild's shelve exists but cannot be read
+        '''
+        if guildid in self._migrated:
+            return
+        error = self._migration_errors.get(guildid)
+        if error is not None:
+            # a fresh exception, re-raising the cached one would keep growing its traceback
+            raise MigrationError(*error.args)
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM migrated_guilds WHERE guild_id = ?', (guildid,)).fetchone()
+        if row is None:
+            # read the shelve without holding the lock, other guilds keep working meanwhile
+            try:
+                ratings = _read_shelve_ratings(os.path.join(self.shelve_dir, str(guildid)))
+            except MigrationError as e:
+                self._migration_errors[guildid] = e
+                raise
+            with self._lock, self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                # another thread or process may have migrated the guild while we read the shelve
+                cursor = self._conn.execute('INSERT OR IGNORE INTO migrated_guilds (guild_id) VALUES (?)', (guildid,))
+                if cursor.rowcount == 0:
+                    ratings = {}
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO ratings (guild_id, user_id, mu, sigma) VALUES (?, ?, ?, ?)',
+                    ((guildid, int(userid), float(mu), float(sigma)) for userid, (mu, sigma) in ratings.items()))
+            if ratings:
+                log.info(f'Migrated {len(ratings)} ratings from shelve', extra={'guild': guildid})
+        self._migrated.add(guildid)
+
+    # reads
+    def get(self, guildid, userid):
+        '''
+        :return: (mu, sigma) of userid in guildid, or None if not stored
+        '''
+        guildid, userid = int(guildid), int(userid)
+        self._ensure_migrated(guildid)
+        with self._lock:
+            if (guildid, userid) in self._pending:
+                return self._pending[guildid, userid]
+            snapshot = self._snapshot(guildid)
+            if snapshot is not None:
+                return snapshot.get_many([userid]).get(userid)
+            row = self._conn.execute('SELECT mu, sigma FROM ratings WHERE guild_id = ? AND user_id = ?', (guildid, userid)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def get_many(self, guildid, userids):
+        '''
+        :return: dict of userid -> (mu, sigma) for every stored userid in userids
+        '''
+        guildid = int(guildid)
+        userids = [int(userid) for userid in userids]
+        self._ensure_migrated(guildid)
+        result = {}
+        with self._lock:
+            snapshot = self._snapshot(guildid)
+            if snapshot is not None:
+                # the whole lobby in one vectorized lookup
+                result = snapshot.get_many(userids)
+            else:
+                for start in range(0, len(userids), 500):
+                    chunk = userids[start:start+500]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows = self._conn.execute(
+                        f'SELECT user_id, mu, sigma FROM ratings WHERE guild_id = ? AND user_id IN ({placeholders})',
+                        (guildid, *chunk))
+                    result.update((userid, (mu, sigma)) for userid, mu, sigma in rows)
+            for userid in userids:
+                if (guildid, userid) in self._pending:
+                    result[userid] = self._pending[guildid, userid]
+        return result
+
+    def all(self, guildid):
+        '''
+        :return: dict of userid -> (mu, sigma) for every player stored in guildid
+        '''
+        guildid = int(guildid)
+        self._ensure_migrated(guildid)
+        with self._lock:
+            snapshot = self._snapshot(guildid)
+            if snapshot is not None:
+                result = snapshot.as_dict()
+            else:
+                rows = self._conn.execute('SELECT user_id, mu, sigma FROM ratings WHERE guild_id = ?', (guildid,))
+                result = {userid: (mu, sigma) for userid, mu, sigma in rows}
+            result.update((userid, rating) for (gid, userid), rating in self._pending.items() if gid == guildid)
+        return result
+
+    # writes
+    def set(self, guildid, userid, mu, sigma):
+        self.set_many(guildid, {userid: (mu, sigma)})
+
+    def set_many(self, guildid, ratings):
+        '''
+        Buffers rating writes for a guild.
+        :param ratings: dict of userid -> (mu, sigma)
+        '''
+        guildid = int(guildid)
+        self._ensure_migrated(guildid)
+        with self._lock:
+            self._invalidate(guildid)
+            for userid, (mu, sigma) in ratings.items():
+                self._pending[guildid, int(userid)] = float(mu), float(sigma)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def clear(self, guildid):
+        guildid = int(guildid)
+        self._ensure_migrated(guildid)
+        with self._lock:
+            self._invalidate(guildid)
+            for key in [key for key in self._pending if key[0] == guildid]:
+                del self._pending[key]
+            self._conn.execute('DELETE FROM ratings WHERE guild_id = ?', (guildid,))
+
+    def replace(self, guildid, ratings, in_transaction=None):
+        '''
+        Replaces every stored rating of a guild in a single transaction, so other readers
+        and a crash see either all the old or all the new ratings.
+        :param ratings: dict of userid -> (mu, sigma)
+        :param in_transaction: optional callable run with the store's connection inside the same
+            transaction, for writes to other tables that must commit or roll back with the ratings
+        '''
+        guildid = int(guildid)
+        self._ensure_migrated(guildid)
+        with self._lock:
+            self._invalidate(guildid)
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                self._conn.execute('DELETE FROM ratings WHERE guild_id = ?', (guildid,))
+                self._conn.executemany(
+                    'INSERT INTO ratings (guild_id, user_id, mu, sigma) VALUES (?, ?, ?, ?)',
+                    ((guildid, int(userid), float(mu), float(sigma)) for userid, (mu, sigma) in ratings.items()))
+                if in_transaction is not None:
+                    in_transaction(self._conn)
+            # buffered writes are older than the new ratings, drop them once those are committed
+            for key in [key for key in self._pending if key[0] == guildid]:
+                del self._pending[key]
+
+    def flush(self):
+        '''
+        Writes all buffered ratings in a single transaction.
+        '''
+        with self._lock:
+            if not self._pending or self._closed:
+                return
+            rows = [(guildid, userid, mu, sigma) for (guildid, userid), (mu, sigma) in self._pending.items()]
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO ratings (guild_id, user_id, mu, sigma) VALUES (?, ?, ?, ?)', rows)
+            self._pending.clear()
+
+    # snapshots
+    def _snapshot(self, guildid):
+        '''
+        Call with self._lock held.
+        :return: the guild's open Snapshot, or None if it has none
+        '''
+        if guildid in self._snapshots:
+            self._snapshots.move_to_end(guildid)
+            return self._snapshots[guildid]
+        snapshot = None
+        if guildid not in self._dirty:
+            try:
+                snapshot = Snapshot(snapshot_path(self.snapshot_dir, guildid))
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                log.warning(f'Ignoring unreadable snapshot: {e}', extra={'guild': guildid})
+        self._snapshots[guildid] = snapshot
+        if len(self._snapshots) > MAX_OPEN_SNAPSHOTS:
+            _, oldest = self._snapshots.popitem(last=False)
+            if oldest is not None:
+                oldest.close()
+        return snapshot
+
+    def _invalidate(self, guildid):
+        '''
+        Call with self._lock held before writing to a guild: its snapshot no longer matches.
+        '''
+        self._generations[guildid] = self._generations.get(guildid, 0) + 1
+        if guildid in self._dirty:
+            return
+        self._dirty.add(guildid)
+        snapshot = self._snapshots.pop(guildid, None)
+        if snapshot is not None:
+            snapshot.close()
+        try:
+            os.remove(snapshot_path(self.snapshot_dir, guildid))
+        except FileNotFoundError:
+            pass
+
+    def snapshot(self, guildid):
+        '''
+        Writes a snapshot of a guild's ratings, unless they are written to while it is taken.
+        :return: True if the snapshot was written
+        '''
+        guildid = int(guildid)
+        with self._lock:
+            if self._closed:
+                return False
+            generation = self._generations.get(guildid, 0)
+            self.flush()
+            ratings = self.all(guildid)
+        path = snapshot_path(self.snapshot_dir, guildid)
+        # the file is written without holding the lock, only the rename needs it
+        tmp = prepare_snapshot(path, ratings)
+        with self._lock:
+            if self._closed or self._generations.get(guildid, 0) != generation:
+                os.remove(tmp)
+                return False
+            commit_snapshot(tmp, path)
+            self._dirty.discard(guildid)
+            self._snapshots.pop(guildid, None)
+        return True
+
+    def snapshot_dirty(self):
+        '''
+        Snapshots every guild written since its last snapshot.
+        :return: number of snapshots written
+        '''
+        written = 0
+        for guildid in list(self._dirty):
+            try:
+                written += self.snapshot(guildid)
+            except (OSError, sqlite3.Error) as e:
+                log.error(f'Snapshot failed: {e}', extra={'guild': guildid})
+        return written
+
+    def _flush_loop(self):
+        last_snapshot = time.monotonic()
+        while not self._closed:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                log.error(f'Rating flush failed: {e}')
+            if time.monotonic() - last_snapshot >= self.snapshot_interval and not self._closed:
+                last_snapshot = time.monotonic()
+                self.snapshot_dirty()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self.flush()
+            # a fresh snapshot of every changed guild makes the next start fast
+            self.snapshot_dirty()
+            self._closed = True
+            for snapshot in self._snapshots.values():
+                if snapshot is not None:
+                    snapshot.close()
+            self._snapshots.clear()
+            self._conn.close()
+
+
+def _read_shelve_ratings(path):
+    '''
+    Reads the 'ratings' dict out of a legacy shelve file.
+    :param path: shelve path without the backend's suffix
+    :return: dict of userid -> (mu, sigma), empty if there is no shelve
+    :raises MigrationError: if a shelve exists but cannot be read, e.g. no matching dbm backend is installed
+    '''
+    if not any(os.path.exists(path + suffix) for suffix in SHELVE_SUFFIXES):
+        return {}
+    try:
+        with shelve.open(path, flag='r') as db:
+            return dict(db.get('ratings', {}))
+    except (*dbm.error, ImportError) as e:
+        log.error(f'Could not read shelve {path} for migration, leaving it unmigrated: {e}')
+        raise MigrationError(f'could not read {path}: {e}') from e
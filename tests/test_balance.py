@@ -0,0 +1,49 @@
+import random
+
+import numpy as np
+import trueskill as ts
+
+from balance import balance_matches, balance_teams, batch_quality
+
+
+def random_ratings(count, seed):
+    rng = random.Random(seed)
+    return {id: ts.Rating(rng.gauss(25, 6), rng.uniform(1, 8.4)) for id in range(count)}
+
+
+def test_batch_quality_matches_ts_quality():
+    ratings = random_ratings(12, seed=1)
+    players = list(ratings)
+    mus = [ratings[id].mu for id in players]
+    sigmas = [ratings[id].sigma for id in players]
+    rng = random.Random(2)
+    teams = np.zeros((200, len(players)), dtype=np.int8)
+    for row in teams:
+        # random team sizes, with some players sitting out
+        picked = rng.sample(range(len(players)), rng.randint(2, len(players)))
+        cut = rng.randint(1, len(picked) - 1)
+        row[picked[:cut]] = 1
+        row[picked[cut:]] = -1
+    qualities = batch_quality(mus, sigmas, teams)
+    for row, quality in zip(teams, qualities):
+        team1 = [ratings[players[i]] for i in np.flatnonzero(row == 1)]
+        team2 = [ratings[players[i]] for i in np.flatnonzero(row == -1)]
+        assert abs(quality - ts.quality([team1, team2])) < 1e-12
+
+
+def test_balance_teams_reports_ts_quality():
+    for count in (2, 7, 10, 12, 13, 30):
+        ratings = random_ratings(count, seed=count)
+        for team1, team2, quality in balance_teams(ratings, top_k=3):
+            assert sorted(team1 + team2) == sorted(ratings)
+            assert len(team1) == count // 2
+            assert abs(quality - ts.quality([[ratings[id] for id in team1], [ratings[id] for id in team2]])) < 1e-12
+
+
+def test_balance_matches_reports_ts_quality():
+    ratings = random_ratings(30, seed=3)
+    matches = balance_matches(ratings, team_size=5, deadline=0.05)
+    assert sorted(id for team1, team2, _ in matches for id in team1 + team2) == sorted(ratings)
+    for team1, team2, quality in matches:
+        assert len(team1) == len(team2) == 5
+        assert abs(quality - ts.quality([[ratings[id] for id in team1], [ratings[id] for id in team2]])) < 1e-12
@@ -0,0 +1,57 @@
+from cache import RatingsCache
+
+
+def test_per_guild_limit_evicts_least_recent_player():
+    cache = RatingsCache(per_guild_limit=3, global_limit=100)
+    cache.put_many(1, {10: 'a', 11: 'b', 12: 'c'})
+    # a hit makes 10 the most recent
+    assert cache.get(1, 10) == 'a'
+    cache.put(1, 13, 'd')
+    assert (1, 11) not in cache
+    assert all((1, userid) in cache for userid in (10, 12, 13))
+    assert len(cache) == 3
+    assert cache.evictions == 1
+
+
+def test_global_limit_skips_pinned_guilds():
+    cache = RatingsCache(per_guild_limit=10, global_limit=6)
+    cache.put_many(1, {10: 'a', 11: 'b', 12: 'c'})
+    cache.put_many(2, {20: 'a', 21: 'b'})
+    cache.pin(1)
+    # guild 1 is least recently used but pinned, so guild 2 goes
+    cache.put_many(3, {30: 'a', 31: 'b'})
+    assert (1, 10) in cache
+    assert (2, 20) not in cache
+    assert (3, 30) in cache
+    assert len(cache) == 5
+    assert cache.evictions == 2
+    cache.unpin(1)
+    cache.put_many(4, {40: 'a', 41: 'b'})
+    assert (1, 10) not in cache
+    assert len(cache) == 4
+
+
+def test_warm_load_keeps_newer_entries():
+    cache = RatingsCache()
+    cache.put(1, 10, 'new')
+    cache.warm_load(1, {10: 'stored', 11: 'stored'})
+    assert cache.get(1, 10) == 'new'
+    assert cache.get(1, 11) == 'stored'
+
+
+def test_stats_count_hits_misses_and_evictions():
+    cache = RatingsCache(per_guild_limit=1, global_limit=100)
+    cache.put(1, 10, 'a')
+    cache.get(1, 10)
+    cache.get(1, 11)
+    cache.get(2, 10)
+    cache.put(1, 11, 'b')
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['evictions'] == 1
+    assert stats['hit_rate'] == 1 / 3
+    assert stats['size'] == 1
+    assert stats['guilds'] == 1
+    cache.drop_guild(1)
+    assert len(cache) == 0
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+import trueskill as ts
+
+from history import ATTACKERS_WON, DEFENDERS_WON, MatchLog, env_settings, replay, replay_rows
+from storage import RatingStore
+
+
+def random_matches(count, players, seed):
+    rng = random.Random(seed)
+    matches = []
+    for _ in range(count):
+        lobby = rng.sample(range(players), 10)
+        matches.append((lobby[:5], lobby[5:]))
+    return matches
+
+
+def rate_sequentially(matches, env, initial=None):
+    ratings = {id: env.create_rating(mu, sigma) for id, (mu, sigma) in (initial or {}).items()}
+    for winners, losers in matches:
+        teams = [{id: ratings.get(id, env.create_rating()) for id in team} for team in (winners, losers)]
+        for team in env.rate(teams, [0, 1]):
+            ratings.update(team)
+    return {id: (rating.mu, rating.sigma) for id, rating in ratings.items()}
+
+
+def assert_close(actual, expected, tolerance=1e-12):
+    assert actual.keys() == expected.keys()
+    for id, (mu, sigma) in expected.items():
+        assert abs(actual[id][0] - mu) < tolerance
+        assert abs(actual[id][1] - sigma) < tolerance
+
+
+def test_replay_matches_ts_rate():
+    env = ts.TrueSkill(draw_probability=0.05)
+    matches = random_matches(300, players=40, seed=1)
+    assert_close(replay(matches, env), rate_sequentially(matches, env))
+
+
+def test_replay_starts_from_baseline():
+    env = ts.TrueSkill(draw_probability=0.05)
+    rng = random.Random(2)
+    initial = {id: (rng.gauss(25, 5), rng.uniform(1, 8)) for id in range(20)}
+    matches = random_matches(100, players=30, seed=3)
+    assert_close(replay(matches, env, initial), rate_sequentially(matches, env, initial))
+
+
+def test_logged_matches_replay_in_worker_form(tmp_path):
+    env = ts.TrueSkill(draw_probability=0.05)
+    log = MatchLog(str(tmp_path / 'ratings.sqlite3'))
+    matches = random_matches(50, players=30, seed=4)
+    for index, (winners, losers) in enumerate(matches):
+        # alternate which side is stored as the attackers
+        if index % 2:
+            log.append(1, winners, losers, ATTACKERS_WON)
+        else:
+            log.append(1, losers, winners, DEFENDERS_WON)
+    log.append(1, [1, 2, 3, 4, 5], [6, 7, 8, 9, 10], ATTACKERS_WON)
+    assert log.undo_last(1) == 1
+    assert list(log.matches(1)) == matches
+    assert replay_rows(log.rows(1), env_settings(env)) == replay(matches, env)
+
+
+def test_undo_commits_with_replaced_ratings(tmp_path):
+    db = str(tmp_path / 'ratings.sqlite3')
+    log = MatchLog(db)
+    store = RatingStore(db, shelve_dir=str(tmp_path))
+    for index in range(3):
+        log.append(1, [index], [index + 10], ATTACKERS_WON)
+    store.set_many(1, {1: (30.0, 5.0), 2: (20.0, 5.0)})
+    ids = log.last_ids(1, 2)
+    assert len(log.rows(1, exclude=ids)) == 1
+
+    def fail(conn):
+        log.undo(ids, conn)
+        raise RuntimeError
+    # a failed replace leaves both the ratings and the match log untouched
+    with pytest.raises(RuntimeError):
+        store.replace(1, {3: (25.0, 8.0)}, in_transaction=fail)
+    assert store.all(1) == {1: (30.0, 5.0), 2: (20.0, 5.0)}
+    assert log.count(1) == 3
+
+    store.replace(1, {3: (25.0, 8.0)}, in_transaction=lambda conn: log.undo(ids, conn))
+    assert store.all(1) == {3: (25.0, 8.0)}
+    assert log.count(1) == 1
+    store.close()
@@ -0,0 +1,63 @@
+from leaderboard import LeaderboardIndex
+
+
+def ranked(count):
+    # player i has the i-th best rating
+    return LeaderboardIndex({id: (100.0 - id, 1.0) for id in range(count)})
+
+
+def test_ties_share_a_rank():
+    board = LeaderboardIndex({1: (30.0, 2.0), 2: (25.0, 2.0), 3: (25.0, 2.0), 4: (25.0, 3.0), 5: (20.0, 1.0)})
+    assert [board.rank(id) for id in range(1, 6)] == [1, 2, 2, 4, 5]
+    assert [rank for rank, *_ in board.page()] == [1, 2, 2, 4, 5]
+    assert board.rank(6) is None
+
+
+def test_page_bounds():
+    board = ranked(20)
+    assert [userid for _, userid, _, _ in board.page(0, 5)] == [0, 1, 2, 3, 4]
+    assert [rank for rank, *_ in board.page(18, 5)] == [19, 20]
+    assert board.page(25, 5) == []
+
+
+def test_around_near_the_top():
+    board = ranked(50)
+    window = board.around(1, count=15)
+    assert [userid for _, userid, _, _ in window] == list(range(15))
+
+
+def test_around_in_the_middle():
+    board = ranked(50)
+    window = board.around(25, count=15)
+    assert [userid for _, userid, _, _ in window] == list(range(18, 33))
+
+
+def test_around_at_the_end():
+    board = ranked(50)
+    window = board.around(49, count=15)
+    assert [userid for _, userid, _, _ in window] == list(range(35, 50))
+    # a board smaller than a page shows everyone
+    assert [userid for _, userid, _, _ in ranked(4).around(3, count=15)] == [0, 1, 2, 3]
+    assert board.around(99) == []
+
+
+def test_update_and_remove():
+    board = ranked(10)
+    board.update(9, 200.0, 1.0)
+    assert board.rank(9) == 1
+    assert board.rank(0) == 2
+    assert len(board) == 10
+    board.update(9, 0.0, 1.0)
+    assert board.rank(9) == 10
+    assert len(board) == 10
+    board.remove(0)
+    assert 0 not in board
+    assert board.rank(0) is None
+    assert board.rank(1) == 1
+    assert len(board) == 9
+    # removing an unranked player is a no-op
+    board.remove(0)
+    assert len(board) == 9
+    board.update(0, 50.0, 1.0)
+    assert 0 in board
+    assert board.page(0, 1)[0][1] == 1
@@ -0,0 +1,83 @@
+import os
+import random
+
+import pytest
+
+from snapshot import Snapshot, snapshot_path, write_snapshot
+from storage import RatingStore
+
+
+def random_ratings(count, seed):
+    rng = random.Random(seed)
+    return {rng.getrandbits(62): (rng.gauss(25, 5), rng.uniform(1, 8)) for _ in range(count)}
+
+
+def test_snapshot_round_trip(tmp_path):
+    ratings = random_ratings(1000, seed=1)
+    path = str(tmp_path / '1.ratings')
+    write_snapshot(path, ratings)
+    snapshot = Snapshot(path)
+    assert len(snapshot) == len(ratings)
+    assert snapshot.as_dict() == ratings
+    lobby = list(ratings)[:10] + [12345]
+    assert snapshot.get_many(lobby) == {id: ratings[id] for id in lobby[:10]}
+    snapshot.close()
+
+
+def test_empty_and_truncated_snapshots(tmp_path):
+    path = str(tmp_path / '1.ratings')
+    write_snapshot(path, {})
+    snapshot = Snapshot(path)
+    assert snapshot.get_many([1, 2]) == {}
+    snapshot.close()
+    write_snapshot(path, random_ratings(10, seed=2))
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 8)
+    with pytest.raises(ValueError):
+        Snapshot(path)
+
+
+def test_store_snapshot_matches_database(tmp_path):
+    db = str(tmp_path / 'ratings.sqlite3')
+    ratings = random_ratings(500, seed=3)
+    store = RatingStore(db, shelve_dir=str(tmp_path))
+    store.set_many(1, ratings)
+    store.close()
+    # closing snapshots changed guilds; a new store reads them instead of SQLite
+    path = snapshot_path(store.snapshot_dir, 1)
+    assert os.path.exists(path)
+    store = RatingStore(db, shelve_dir=str(tmp_path))
+    assert store.all(1) == ratings
+    assert store._snapshot(1) is not None
+
+    # the first write invalidates the snapshot, reads fall back to the database
+    userid = next(iter(ratings))
+    store.set(1, userid, 30.0, 2.0)
+    assert not os.path.exists(path)
+    assert store.get(1, userid) == (30.0, 2.0)
+    store.flush()
+    assert store._snapshot(1) is None
+    assert store.all(1) == {**ratings, userid: (30.0, 2.0)}
+
+    # a fresh snapshot has the new rating
+    assert store.snapshot(1)
+    assert Snapshot(path).as_dict() == {**ratings, userid: (30.0, 2.0)}
+    store.close()
+
+
+def test_snapshot_discarded_when_written_concurrently(tmp_path, monkeypatch):
+    import storage
+    store = RatingStore(str(tmp_path / 'ratings.sqlite3'), shelve_dir=str(tmp_path))
+    store.set(1, 1, 25.0, 8.0)
+    prepare = storage.prepare_snapshot
+
+    def write_while_preparing(path, ratings):
+        tmp = prepare(path, ratings)
+        store.set(1, 2, 20.0, 7.0)
+        return tmp
+    monkeypatch.setattr(storage, 'prepare_snapshot', write_while_preparing)
+    assert not store.snapshot(1)
+    assert not os.path.exists(snapshot_path(store.snapshot_dir, 1))
+    assert [name for name in os.listdir(store.snapshot_dir) if name.endswith('.tmp')] == []
+    monkeypatch.undo()
+    store.close()
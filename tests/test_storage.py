@@ -0,0 +1,71 @@
+import os
+import shelve
+
+import pytest
+
+import storage
+from storage import MigrationError, RatingStore
+
+
+def open_store(tmp_path, **kwargs):
+    return RatingStore(str(tmp_path / 'ratings.sqlite3'), shelve_dir=str(tmp_path), **kwargs)
+
+
+def migrated_guilds(store):
+    return {row[0] for row in store._conn.execute('SELECT guild_id FROM migrated_guilds')}
+
+
+def test_guild_without_shelve(tmp_path):
+    store = open_store(tmp_path)
+    assert store.get(1, 10) is None
+    assert store.all(1) == {}
+    assert migrated_guilds(store) == {1}
+    store.close()
+
+
+def test_shelve_imported_once(tmp_path):
+    with shelve.open(str(tmp_path / '1')) as db:
+        db['ratings'] = {10: (30.0, 4.0), 11: (20.0, 6.0)}
+    store = open_store(tmp_path)
+    assert store.all(1) == {10: (30.0, 4.0), 11: (20.0, 6.0)}
+    store.set(1, 10, 32.0, 3.0)
+    store.close()
+
+    # the shelve is still there, but a restarted bot keeps the newer rating
+    store = open_store(tmp_path)
+    assert store.get(1, 10) == (32.0, 3.0)
+    assert store.get_many(1, [10, 11, 12]) == {10: (32.0, 3.0), 11: (20.0, 6.0)}
+    store.close()
+
+
+def test_unreadable_shelve_left_unmigrated(tmp_path, monkeypatch):
+    with open(tmp_path / '1.db', 'wb') as f:
+        f.write(b'not a dbm file')
+    reads = []
+    read = storage._read_shelve_ratings
+    monkeypatch.setattr(storage, '_read_shelve_ratings', lambda path: reads.append(path) or read(path))
+    store = open_store(tmp_path)
+    with pytest.raises(MigrationError):
+        store.get(1, 10)
+    # the failure is remembered instead of reading the shelve on every call
+    with pytest.raises(MigrationError):
+        store.set_many(1, {10: (25.0, 8.0)})
+    assert len(reads) == 1
+    assert 1 not in migrated_guilds(store)
+    # other guilds are unaffected
+    store.set(2, 10, 25.0, 8.0)
+    assert store.get(2, 10) == (25.0, 8.0)
+    store.close()
+    assert os.path.exists(tmp_path / '1.db')
+
+
+def test_buffered_writes_visible_before_flush(tmp_path):
+    store = open_store(tmp_path, flush_interval=3600, batch_size=1000)
+    store.set_many(1, {10: (30.0, 4.0), 11: (20.0, 6.0)})
+    assert store._conn.execute('SELECT COUNT(*) FROM ratings').fetchone()[0] == 0
+    assert store.get(1, 10) == (30.0, 4.0)
+    assert store.get_many(1, [10, 11, 12]) == {10: (30.0, 4.0), 11: (20.0, 6.0)}
+    assert store.all(1) == {10: (30.0, 4.0), 11: (20.0, 6.0)}
+    store.flush()
+    assert store._conn.execute('SELECT COUNT(*) FROM ratings').fetchone()[0] == 2
+    store.close()
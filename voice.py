@@ -0,0 +1,68 @@
+import asyncio
+
+import aiohttp
+import discord
+
+# most member moves in flight at once
+MOVE_CONCURRENCY = 5
+
+# attempts per member before a move counts as failed
+MOVE_ATTEMPTS = 3
+
+# seconds to wait before the first retry, doubled on every further retry
+RETRY_DELAY = 0.5
+
+
+class MoveSummary:
+    '''
+    Outcome of a bulk move: members moved, skipped (not in voice or already there) and failed.
+    '''
+
+    def __init__(self):
+        self.moved = []
+        self.skipped = []
+        self.failed = []
+
+    def __str__(self):
+        count = len(self.moved)
+        output = f"{count} player{'s' if count != 1 else ''} moved."
+        if self.failed:
+            output += f" Failed to move {', '.join(f'<@!{member.id}>' for member in self.failed)}."
+        return output
+
+
+async def move_members(moves, concurrency=MOVE_CONCURRENCY, attempts=MOVE_ATTEMPTS):
+    '''
+    Moves members to voice channels concurrently.
+    discord.py already waits out 429s on each route's rate-limit bucket, so this only
+    bounds how many requests share the bucket at once and retries transient failures
+    (5xx responses and connection errors). Permission errors are not retried.
+    :param moves: iterable of (discord.Member, discord.VoiceChannel) pairs
+    :return: MoveSummary
+    '''
+    summary = MoveSummary()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def move(member, channel):
+        if member is None:
+            return
+        if member.voice is None or member.voice.channel == channel:
+            summary.skipped.append(member)
+            return
+        async with semaphore:
+            for attempt in range(attempts):
+                try:
+                    await member.move_to(channel)
+                    summary.moved.append(member)
+                    return
+                except discord.HTTPException as e:
+                    if e.status < 500:
+                        break
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(RETRY_DELAY * 2 ** attempt)
+            summary.failed.append(member)
+
+    await asyncio.gather(*(move(member, channel) for member, channel in moves))
+    return summary